@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+import os
+import ast
+import json
+import hashlib
+from importlib import metadata
+
+
+def hash_file(file_path, block_size=2 ** 20):
+    """
+    SHA-256 digest of a file's content, read in blocks.
+
+    Parameters
+    ----------
+    file_path : str
+    block_size : int
+
+    Returns
+    -------
+    str
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_signature(file_path):
+    """
+    Size and modification time (ns) of a file, a cheap proxy of its content
+    as used by make and rsync.
+    """
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def hash_files(file_paths, previous=None):
+    """
+    SHA-256 digests of files plus their ``file_signature``. Digests of an
+    earlier result are reused for files whose signature is unchanged, so
+    only new or modified files are read.
+
+    Parameters
+    ----------
+    file_paths : dict
+        file path per key
+    previous : dict, None
+        earlier result with the same keys
+
+    Returns
+    -------
+    dict
+        ``{"sha256": str, "size": int, "mtime_ns": int}`` per key
+    """
+    if previous is None:
+        previous = {}
+
+    hashes = {}
+    for key, file_path in file_paths.items():
+        size, mtime_ns = file_signature(file_path)
+        entry = previous.get(key, {})
+        if (entry.get("size"), entry.get("mtime_ns")) != (size, mtime_ns):
+            entry = {
+                "sha256": hash_file(file_path),
+                "size": size,
+                "mtime_ns": mtime_ns,
+            }
+        hashes[key] = entry
+    return hashes
+
+
+def _node_name(node):
+    # name defined by a function, class or assignment statement
+    if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+        return node.name
+    if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+        return node.targets[0].id
+    return None
+
+
+def _module_nodes(source):
+    # top-level and "Class.name" definitions of a module's source
+    nodes = {}
+    for node in ast.parse(source).body:
+        name = _node_name(node)
+        if name is None:
+            continue
+        nodes[name] = node
+
+        if isinstance(node, ast.ClassDef):
+            for child in node.body:
+                child_name = _node_name(child)
+                if child_name is not None:
+                    nodes[name + "." + child_name] = child
+    return nodes
+
+
+def source_names(fpath, roots):
+    """
+    Names of the top-level functions, classes and assignments of a module
+    that ``roots`` use, directly or through each other, including the roots.
+    Within a class, ``self.name`` and ``cls.name`` refer to
+    ``"Class.name"``. The result is meant for ``source_digest``, so that a
+    new helper of the roots is part of the digest without being listed.
+
+    Parameters
+    ----------
+    fpath : str
+        path of the module's source file
+    roots : iterable
+        top-level or ``"Class.name"`` names
+
+    Returns
+    -------
+    list
+    """
+    with open(fpath) as f:
+        nodes = _module_nodes(f.read())
+
+    names, stack = set(), list(roots)
+    while stack:
+        name = stack.pop()
+        if name in names:
+            continue
+        if name not in nodes:
+            raise KeyError("{} not defined in {}".format(name, fpath))
+        names.add(name)
+
+        cls = name.split(".")[0] if "." in name else None
+        for node in ast.walk(nodes[name]):
+            if isinstance(node, ast.Name) and node.id in nodes:
+                stack.append(node.id)
+            elif (
+                cls is not None
+                and isinstance(node, ast.Attribute)
+                and isinstance(node.value, ast.Name)
+                and node.value.id in ("self", "cls")
+                and cls + "." + node.attr in nodes
+            ):
+                stack.append(cls + "." + node.attr)
+
+    return sorted(names)
+
+
+def source_digest(fpath, names=None):
+    """
+    SHA-256 digest of the source code of a module, or only of its top-level
+    functions, classes and assignments listed in ``names``; a class's
+    methods and attributes are named ``"Class.name"``. The module is parsed
+    rather than imported, so no heavy dependencies are loaded.
+
+    Parameters
+    ----------
+    fpath : str
+        path of the module's source file
+    names : iterable, None
+        top-level or ``"Class.name"`` names to hash, the whole module if
+        None
+
+    Returns
+    -------
+    str
+    """
+    with open(fpath) as f:
+        source = f.read()
+
+    if names is None:
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    segments = {
+        name: ast.get_source_segment(source, node)
+        for name, node in _module_nodes(source).items()
+    }
+
+    missing = set(names) - set(segments)
+    if missing:
+        raise KeyError(
+            "{} not defined in {}".format(", ".join(sorted(missing)), fpath)
+        )
+
+    sha = hashlib.sha256()
+    for name in sorted(names):
+        sha.update(segments[name].encode("utf-8"))
+    return sha.hexdigest()
+
+
+def package_versions(names):
+    """
+    Installed versions of the given distributions (None if missing).
+    """
+    versions = {}
+    for name in names:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def artefact_key(params=None, code=(), upstream=(), length=12):
+    """
+    Cache key of a pipeline artefact: a hash of the parameters of the stage
+    producing it, the digests of the code implementing the stage and the
+    keys of the upstream artefacts it is computed from. Any change to one of
+    these yields a new key, hence only affected downstream stages recompute.
+
+    Parameters
+    ----------
+    params : dict, None
+        JSON-serialisable stage parameters
+    code : iterable
+        source digests, see ``source_digest``
+    upstream : iterable
+        keys of the input artefacts
+    length : int
+        number of hex characters kept
+
+    Returns
+    -------
+    str
+    """
+    payload = json.dumps(
+        {"params": params, "code": list(code), "upstream": list(upstream)},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:length]
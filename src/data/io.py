@@ -1,11 +1,39 @@
 # -*- coding: utf-8 -*-
+import os
+import copy
+import glob
+import gzip
+import json
+import mmap
+import shutil
 import logging
+from array import array
+import numpy as np
+import scipy.sparse as sp
+import spacy
 import textacy
+import textacy.tm
+import textacy.vsm
 import pandas as pd
+from scipy.special import psi
+from sklearn.decomposition import NMF, LatentDirichletAllocation, TruncatedSVD
+from src.data import tables
+
+# token attributes serialised per doc (orth and whitespace are always stored)
+DOCBIN_ATTRS = ("ORTH", "SPACY", "LEMMA", "TAG", "ENT_IOB", "ENT_TYPE")
+
+# sklearn estimators of textacy.tm.TopicModel, see read_topic_model
+TOPIC_MODEL_ESTIMATORS = {
+    "NMF": NMF,
+    "LatentDirichletAllocation": LatentDirichletAllocation,
+    "TruncatedSVD": TruncatedSVD,
+}
 
 
 def read_corpus(fpath, language_model, store_user_data=True):
     """
+    Read a corpus saved by ``textacy.Corpus.save`` or, if ``fpath`` is the
+    directory of an indexed corpus, a lazy ``IndexedCorpus`` view of it.
 
     Parameters
     ----------
@@ -18,22 +46,662 @@ def read_corpus(fpath, language_model, store_user_data=True):
 
     Returns
     -------
-    textacy.Corpus
+    textacy.Corpus, IndexedCorpus
         corpus instance
     """
     logger = logging.getLogger(__name__)
     logger.info("Reading pre-computed corpus.")
 
+    if os.path.isdir(fpath):
+        return IndexedCorpus(
+            fpath, language_model, store_user_data=store_user_data
+        )
+
     return textacy.Corpus.load(
         lang=language_model, filepath=fpath, store_user_data=store_user_data
     )
 
 
+class CorpusShardWriter:
+    """
+    Stream spaCy docs to a directory of gzipped ``DocBin`` shards. Docs are
+    serialised as soon as they are added and the shard is flushed to disk
+    every ``shard_size`` docs, so memory is bounded by one shard rather than
+    by the whole corpus.
+
+    Parameters
+    ----------
+    dirpath : str
+        directory holding the shards, replaced atomically on ``close``; no
+        shard of an earlier build survives
+    shard_size : int
+        number of docs per shard
+    store_user_data : bool
+        custom extension attributes (e.g. ``doc._.meta``)
+    """
+
+    def __init__(self, dirpath, shard_size=100, store_user_data=True):
+        self.dirpath = dirpath
+        self.shard_size = shard_size
+        self.store_user_data = store_user_data
+        self.n_docs = 0
+        self.n_shards = 0
+        self._doc_bin = None
+        self._closed = False
+
+        self._tmp_dirpath = dirpath + ".tmp"
+        shutil.rmtree(self._tmp_dirpath, ignore_errors=True)
+        os.makedirs(self._tmp_dirpath)
+
+    def add(self, doc):
+        if self._doc_bin is None:
+            self._doc_bin = spacy.tokens.DocBin(
+                attrs=DOCBIN_ATTRS, store_user_data=self.store_user_data
+            )
+        self._doc_bin.add(doc)
+        self.n_docs += 1
+
+        if len(self._doc_bin) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if self._doc_bin is None or len(self._doc_bin) == 0:
+            return
+
+        fpath = os.path.join(
+            self._tmp_dirpath, "shard_{:05d}.bin.gz".format(self.n_shards)
+        )
+        with gzip.open(fpath, "wb") as f:
+            f.write(self._doc_bin.to_bytes())
+
+        self.n_shards += 1
+        self._doc_bin = None
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+        os.replace(self._tmp_dirpath, self.dirpath)
+
+    def abort(self):
+        """
+        Discard the shards written so far, ``dirpath`` is left untouched.
+        """
+        self._closed = True
+        self._doc_bin = None
+        shutil.rmtree(self._tmp_dirpath, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed build never replaces the previous corpus
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_corpus_shards(dirpath, language_model, store_user_data=True):
+    """
+    Lazily yield docs from a directory written by ``CorpusShardWriter``,
+    decoding one shard at a time.
+
+    Parameters
+    ----------
+    dirpath : str
+        shard directory
+    language_model : spaCy
+         nlp
+    store_user_data : bool
+        custom extension attributes
+
+    Yields
+    ------
+    spacy.tokens.Doc
+    """
+    for fpath in sorted(glob.glob(os.path.join(dirpath, "shard_*.bin.gz"))):
+        with gzip.open(fpath, "rb") as f:
+            doc_bin = spacy.tokens.DocBin(
+                store_user_data=store_user_data
+            ).from_bytes(f.read())
+
+        for doc in doc_bin.get_docs(language_model.vocab):
+            yield doc
+
+
+def read_corpus_shards(dirpath, language_model, store_user_data=True):
+    """
+
+    Parameters
+    ----------
+    dirpath : str
+        shard directory
+    language_model : spaCy
+         nlp
+    store_user_data : bool
+        custom extension attributes
+
+    Returns
+    -------
+    textacy.Corpus
+        corpus instance
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Reading pre-computed corpus shards.")
+
+    return textacy.Corpus(
+        language_model,
+        data=iter_corpus_shards(
+            dirpath=dirpath,
+            language_model=language_model,
+            store_user_data=store_user_data,
+        ),
+    )
+
+
+class IndexedCorpusWriter:
+    """
+    Stream spaCy docs to an indexed corpus directory, read lazily and with
+    random access by ``IndexedCorpus``. Each doc is serialised on its own,
+    so that any doc can be decoded without its neighbours.
+
+    Layout of ``dirpath``:
+
+    - ``docs.bin``: one ``DocBin`` (compressed) per doc, concatenated
+    - ``offsets.npy``: int64, doc ``i`` is ``docs.bin[offsets[i]:offsets[i +
+      1]]``
+    - ``meta.json``: ``doc._.meta`` per doc (NaN as null)
+    - ``index.parquet``: metadata index, basin, year (int), month, number of
+      tokens and byte offset per doc id, see ``read_corpus_index``
+
+    Parameters
+    ----------
+    dirpath : str
+        output directory, written atomically on ``close``
+    store_user_data : bool
+        custom extension attributes (e.g. ``doc._.meta``)
+    """
+
+    def __init__(self, dirpath, store_user_data=True):
+        self.dirpath = dirpath
+        self.store_user_data = store_user_data
+        self.n_docs = 0
+
+        self._tmp_dirpath = dirpath + ".tmp"
+        shutil.rmtree(self._tmp_dirpath, ignore_errors=True)
+        os.makedirs(self._tmp_dirpath)
+
+        self._file = open(os.path.join(self._tmp_dirpath, "docs.bin"), "wb")
+        self._offsets = array("q", [0])
+        self._n_tokens = array("q")
+        self._meta = []
+
+    def add(self, doc):
+        doc_bin = spacy.tokens.DocBin(
+            attrs=DOCBIN_ATTRS, store_user_data=self.store_user_data
+        )
+        doc_bin.add(doc)
+        self._file.write(doc_bin.to_bytes())
+        self._offsets.append(self._file.tell())
+        self._n_tokens.append(len(doc))
+        # NaN (e.g. a missing month) is not valid JSON
+        self._meta.append(
+            {
+                key: None if pd.isna(value) else value
+                for key, value in doc._.meta.items()
+            }
+        )
+        self.n_docs += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+
+        np.save(
+            os.path.join(self._tmp_dirpath, "offsets.npy"),
+            np.frombuffer(self._offsets, dtype=np.int64),
+        )
+        with open(os.path.join(self._tmp_dirpath, "meta.json"), "w") as f:
+            json.dump(self._meta, f)
+
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        df_index = pd.DataFrame(
+            {
+                "doc_id": np.arange(self.n_docs),
+                "basin": [meta.get("basin") for meta in self._meta],
+                "year": pd.array(
+                    [
+                        None if meta.get("year") is None else int(meta["year"])
+                        for meta in self._meta
+                    ],
+                    dtype="Int64",
+                ),
+                "month": [meta.get("month") for meta in self._meta],
+                "n_tokens": np.frombuffer(self._n_tokens, dtype=np.int64),
+                "offset": offsets[:-1],
+            }
+        )
+        tables.write_table(
+            df_index,
+            os.path.join(self._tmp_dirpath, "index.parquet"),
+            index=None,
+        )
+
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+        os.replace(self._tmp_dirpath, self.dirpath)
+
+    def abort(self):
+        """
+        Discard the docs written so far, ``dirpath`` is left untouched.
+        """
+        self._file.close()
+        self._meta = []
+        shutil.rmtree(self._tmp_dirpath, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed build never replaces the previous corpus
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class IndexedCorpus:
+    """
+    Lazy, random-access view of a corpus written by ``IndexedCorpusWriter``.
+    Only the index and the metadata are read on construction; docs are
+    decoded one at a time when accessed, from a memory-mapped file, and
+    metadata queries never decode any token data.
+
+    Views share the memory map, ``close`` (or leaving a ``with`` block)
+    unmaps it for all of them; it is mapped again if a doc is accessed
+    afterwards.
+
+    Parameters
+    ----------
+    dirpath : str
+    language_model : spaCy
+         nlp, whose vocabulary the docs are decoded with
+    store_user_data : bool
+        custom extension attributes
+    indices : iterable, None
+        docs of the view, all if None
+    """
+
+    def __init__(
+        self, dirpath, language_model, store_user_data=True, indices=None
+    ):
+        self.dirpath = dirpath
+        self.language_model = language_model
+        self.store_user_data = store_user_data
+
+        # 8 bytes per doc, read into memory so only the docs are mapped
+        self.offsets = np.load(os.path.join(dirpath, "offsets.npy"))
+        with open(os.path.join(dirpath, "meta.json")) as f:
+            self._meta = json.load(f)
+
+        if indices is None:
+            indices = range(len(self._meta))
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+        # shared by all views, see ``take``
+        self._mmaps = {}
+        self._index = None
+
+    @property
+    def lang_(self):
+        return self.language_model.lang
+
+    @property
+    def meta(self):
+        """
+        Metadata of the docs of the view, without decoding them.
+        """
+        return [self._meta[i] for i in self.indices]
+
+    @property
+    def index(self):
+        """
+        Metadata index of the docs of the view, see ``read_corpus_index``.
+        """
+        if self._index is None:
+            self._index = read_corpus_index(self.dirpath)
+        return self._index.loc[self.indices]
+
+    @property
+    def n_tokens(self):
+        return int(self.index["n_tokens"].sum())
+
+    def query(self, **conditions):
+        """
+        View of the docs matching all conditions on the metadata index,
+        evaluated on the index file (see ``read_corpus_index``): a scalar
+        matches equal values, a tuple ``(low, high)`` an inclusive range and
+        a list any of its values, e.g. ``query(basin="Nile", year=(1990,
+        2000))``. Views are iterables of docs, e.g. for
+        ``extract.tokenize_corpus`` or ``visualize.word_counts``.
+
+        Returns
+        -------
+        IndexedCorpus
+        """
+        filters = []
+        for key, value in conditions.items():
+            if isinstance(value, tuple):
+                low, high = value
+                filters += [(key, ">=", low), (key, "<=", high)]
+            elif isinstance(value, (list, set)):
+                filters.append((key, "in", list(value)))
+            else:
+                filters.append((key, "=", value))
+
+        doc_ids = read_corpus_index(
+            self.dirpath, columns=[], filters=filters or None
+        ).index
+        return self.take(self.indices[np.isin(self.indices, doc_ids)])
+
+    def doc(self, i):
+        """
+        Decode doc ``i`` of the stored corpus (not of the view).
+        """
+        if "docs" not in self._mmaps:
+            with open(os.path.join(self.dirpath, "docs.bin"), "rb") as f:
+                self._mmaps["docs"] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+
+        buffer = self._mmaps["docs"]
+        doc_bin = spacy.tokens.DocBin(
+            store_user_data=self.store_user_data
+        ).from_bytes(buffer[self.offsets[i] : self.offsets[i + 1]])
+        return next(iter(doc_bin.get_docs(self.language_model.vocab)))
+
+    def filter(self, predicate):
+        """
+        View of the docs whose metadata satisfy ``predicate``, e.g.
+        ``lambda meta: meta["basin"] == "Nile"``.
+
+        Returns
+        -------
+        IndexedCorpus
+        """
+        return self.take(
+            [i for i in self.indices if predicate(self._meta[i])]
+        )
+
+    def take(self, indices):
+        """
+        View of the stored docs at ``indices``.
+
+        Returns
+        -------
+        IndexedCorpus
+        """
+        # shares index, metadata and memory map
+        view = copy.copy(self)
+        view.indices = np.asarray(indices, dtype=np.int64)
+        return view
+
+    def close(self):
+        """
+        Unmap the docs file, of this corpus and all its views.
+        """
+        while self._mmaps:
+            _, buffer = self._mmaps.popitem()
+            buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        return self.doc(self.indices[position])
+
+    def __iter__(self):
+        for i in self.indices:
+            yield self.doc(i)
+
+
+def read_corpus_index(dirpath, columns=None, filters=None):
+    """
+    Metadata index of an indexed corpus written by ``IndexedCorpusWriter``,
+    indexed by doc id, e.g. ``filters=[("basin", "=", "Nile")]``, see
+    ``tables.read_table``. No doc is decoded.
+
+    Returns
+    -------
+    pd.DataFrame
+        basin, year, month, n_tokens and byte offset per doc id
+    """
+    return tables.read_table(
+        os.path.join(dirpath, "index.parquet"),
+        columns=columns,
+        filters=filters,
+        index="doc_id",
+    )
+
+
+def read_term_ids(dirpath, mmap_mode="r"):
+    """
+    Read term streams written by ``extract.write_term_streams`` without
+    materialising any strings.
+
+    Parameters
+    ----------
+    dirpath : str
+    mmap_mode : str, None
+        memory-map the id arrays (see ``numpy.load``)
+
+    Returns
+    -------
+    vocabulary : list
+        terms, indexed by term id
+    term_ids : np.ndarray
+        term ids of all docs, concatenated
+    doc_offsets : np.ndarray
+        boundaries of the docs in ``term_ids``
+    groups : dict
+        basin and year label per doc
+    """
+    with open(os.path.join(dirpath, "vocabulary.json")) as f:
+        vocabulary = json.load(f)
+    term_ids = np.load(
+        os.path.join(dirpath, "term_ids.npy"), mmap_mode=mmap_mode
+    )
+    doc_offsets = np.load(
+        os.path.join(dirpath, "doc_offsets.npy"), mmap_mode=mmap_mode
+    )
+    with open(os.path.join(dirpath, "groups.json")) as f:
+        groups = json.load(f)
+
+    return vocabulary, term_ids, doc_offsets, groups
+
+
+def read_term_streams(dirpath, mmap_mode="r"):
+    """
+    Read term streams written by ``extract.write_term_streams``, in the
+    format returned by ``extract.tokenize_corpus``.
+
+    Parameters
+    ----------
+    dirpath : str
+    mmap_mode : str, None
+
+    Returns
+    -------
+    tokenized_docs : generator
+        terms list per doc, decoded lazily from the shared vocabulary
+    basin_group : list
+    year_group : list
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Reading pre-computed term streams.")
+
+    vocabulary, term_ids, doc_offsets, groups = read_term_ids(
+        dirpath, mmap_mode=mmap_mode
+    )
+
+    tokenized_docs = (
+        [vocabulary[term_id] for term_id in term_ids[start:end].tolist()]
+        for start, end in zip(doc_offsets[:-1], doc_offsets[1:])
+    )
+
+    return tokenized_docs, groups["basin"], groups["year"]
+
+
+def iter_sparse_row_blocks(dirpath):
+    """
+    Lazily yield the row blocks written by
+    ``train_model.write_sparse_row_blocks``, one block in memory at a time.
+
+    Yields
+    ------
+    scipy.sparse.csr_matrix
+    """
+    for fpath in sorted(glob.glob(os.path.join(dirpath, "block_*.npz"))):
+        yield sp.load_npz(fpath).tocsr()
+
+
+def read_sparse_row_blocks_meta(dirpath):
+    """
+    Number of blocks, rows and columns of the row blocks written by
+    ``train_model.write_sparse_row_blocks``.
+
+    Returns
+    -------
+    dict
+    """
+    with open(os.path.join(dirpath, "meta.json")) as f:
+        return json.load(f)
+
+
 def read_group_term_matrix(fpath, kind="csr"):
     # read group-term matrix
     return textacy.io.matrix.read_sparse_matrix(filepath=fpath, kind=kind)
 
 
-def read_vectorizer(fpath):
-    # read pre-trained vectorizer
-    return pd.read_pickle(fpath)
+def read_vectorizer(fpath, mmap_mode="r"):
+    """
+    Read a fitted GroupVectorizer, either a directory written by
+    ``train_model.write_vectorizer`` or a pickle.
+
+    Parameters
+    ----------
+    fpath : str
+    mmap_mode : str, None
+        memory-map the idf array (see ``numpy.load``)
+
+    Returns
+    -------
+    textacy.vsm.GroupVectorizer
+    """
+    if not os.path.isdir(fpath):
+        return pd.read_pickle(fpath)
+
+    with open(os.path.join(fpath, "params.json")) as f:
+        state = json.load(f)
+    terms = read_vocabulary(fpath, columns=["term"])["term"].tolist()
+    with open(os.path.join(fpath, "groups.json")) as f:
+        groups = json.load(f)
+
+    # vocabularies given as fixed, the fitted state is restored below
+    vectorizer = textacy.vsm.GroupVectorizer(**state["params"])
+    vectorizer.vocabulary_terms = {term: i for i, term in enumerate(terms)}
+    vectorizer.vocabulary_grps = {grp: i for i, grp in enumerate(groups)}
+    vectorizer._avg_doc_length = state["avg_doc_length"]
+
+    idf_fpath = os.path.join(fpath, "idf.npy")
+    if os.path.exists(idf_fpath):
+        idf = np.load(idf_fpath, mmap_mode=mmap_mode)
+        vectorizer._idf_diag = sp.spdiags(
+            idf, diags=0, m=len(terms), n=len(terms), format="csr"
+        )
+
+    return vectorizer
+
+
+def read_vocabulary(dirpath, columns=None, filters=None):
+    """
+    Vocabulary of a vectorizer written by ``train_model.write_vectorizer``,
+    indexed by term id, e.g. ``filters=[("idf", ">", 1.0)]``, see
+    ``tables.read_table``.
+
+    Returns
+    -------
+    pd.DataFrame
+        term and idf per term id
+    """
+    return tables.read_table(
+        os.path.join(dirpath, "vocabulary.parquet"),
+        columns=columns,
+        filters=filters,
+        index="term_id",
+    )
+
+
+def read_topic_model(fpath, mmap_mode="r"):
+    """
+    Read a fitted topic model, either a directory written by
+    ``predict_model.write_topic_model`` or a textacy pickle.
+
+    Only the components are stored; the estimator is rebuilt from its
+    parameters and the state needed by ``transform`` is derived from the
+    components (for LDA the exponentiated Dirichlet expectation).
+
+    Parameters
+    ----------
+    fpath : str
+    mmap_mode : str, None
+        memory-map the components (see ``numpy.load``)
+
+    Returns
+    -------
+    textacy.tm.TopicModel
+    """
+    if not os.path.isdir(fpath):
+        return textacy.tm.TopicModel.load(fpath)
+
+    with open(os.path.join(fpath, "meta.json")) as f:
+        meta = json.load(f)
+    components = np.load(
+        os.path.join(fpath, "components.npy"), mmap_mode=mmap_mode
+    )
+    n_components, n_features = components.shape
+
+    estimator = TOPIC_MODEL_ESTIMATORS[meta["estimator"]](**meta["params"])
+    estimator.components_ = components
+    estimator.n_features_in_ = n_features
+    for name, value in meta["attributes"].items():
+        setattr(estimator, name, value)
+
+    if isinstance(estimator, NMF):
+        estimator.n_components_ = n_components
+    elif isinstance(estimator, LatentDirichletAllocation):
+        estimator.doc_topic_prior_ = (
+            1.0 / n_components
+            if estimator.doc_topic_prior is None
+            else estimator.doc_topic_prior
+        )
+        estimator.topic_word_prior_ = (
+            1.0 / n_components
+            if estimator.topic_word_prior is None
+            else estimator.topic_word_prior
+        )
+        estimator.exp_dirichlet_component_ = np.exp(
+            psi(components) - psi(np.sum(components, axis=1))[:, np.newaxis]
+        )
+
+    return textacy.tm.TopicModel(model=estimator)
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import sys
 import glob
+import json
+import heapq
 import logging
+import itertools
+import collections
+import functools
+import unicodedata
+import multiprocessing
+import spacy
 import textacy
 import gensim
 import numpy as np
 from tqdm import tqdm
-import en_core_web_lg
 from pathlib import Path
 from textacy import preprocessing
+from textacy.preprocessing import resources
 from dotenv import find_dotenv, load_dotenv
 from references import nlp_dicts
+from src.data import cache, io
 
 
 def preprocess_text(
@@ -75,12 +85,505 @@ def preprocess_text(
     return text
 
 
+# runs of ASCII letters, i.e. the tokens gensim.utils.simple_preprocess finds
+# in text that has been reduced to [A-Za-z0-9 ] by preprocess_text
+RE_ASCII_WORD = re.compile(r"[A-Za-z]+")
+
+# normalize_quotation_marks as a scan for the (rare) characters it translates
+RE_QUOTATION_MARK = re.compile(
+    "[{}]".format("".join(map(chr, resources.QUOTE_TRANSLATION_TABLE)))
+)
+
+# normalize_hyphenated_words only ever matches from the start of a word,
+# and never without a letter followed by a hyphen and whitespace
+RE_HYPHENATED_WORD = re.compile(
+    r"(?<!\w)" + resources.RE_HYPHENATED_WORD.pattern,
+    flags=resources.RE_HYPHENATED_WORD.flags,
+)
+RE_HYPHEN_BREAK = re.compile(r"[^\W\d]-\s")
+
+# normalize_whitespace, rewritten to leave text it does not change untouched
+RE_LINEBREAK_RUN = re.compile(r"(?:\r\n|[\n\v]){2,}|\r\n|\v")
+RE_NONBREAKING_SPACE_RUN = re.compile(r"[^\S\n\v]{2,}|[^\S\n\v ]")
+ASCII_NONBREAKING_SPACES = (
+    "  ",
+    "\t",
+    "\r",
+    "\f",
+    "\x1c",
+    "\x1d",
+    "\x1e",
+    "\x1f",
+)
+
+# after normalize_whitespace, tokens are separated by single " " or "\n"
+RE_TOKEN_END = re.compile(r"[ \n]")
+
+# characters every match of a token-local replace_* regex contains
+RE_EMAIL_TRIGGER = re.compile("@")
+RE_HASHTAG_TRIGGER = re.compile("[#\uff03]")
+RE_URL_TRIGGER = re.compile("/|www|@")
+RE_PHONE_DIGITS = re.compile(r"\d{3}[ .-]?\d{4}")
+
+RE_NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+
+
+@functools.lru_cache(maxsize=1)
+def _combining_chars_table():
+    # str.translate table deleting all combining characters
+    return {
+        codepoint: None
+        for codepoint in range(sys.maxunicode + 1)
+        if unicodedata.combining(chr(codepoint))
+    }
+
+
+def _normalize_quotation_mark(match):
+    return chr(resources.QUOTE_TRANSLATION_TABLE[ord(match.group())])
+
+
+def _normalize_whitespace(text):
+    if not text.isascii():
+        text = resources.RE_ZWSP.sub("", text)
+    if "\r" in text or "\v" in text or "\n\n" in text:
+        text = RE_LINEBREAK_RUN.sub("\n", text)
+    if not text.isascii() or any(
+        space in text for space in ASCII_NONBREAKING_SPACES
+    ):
+        text = RE_NONBREAKING_SPACE_RUN.sub(" ", text)
+    return text.strip()
+
+
+def _replace_tokens(text, trigger, replace):
+    # apply replace to each whitespace delimited token containing trigger,
+    # exact for regexes whose matches and look-arounds stay within a token
+    pieces, end = [], 0
+    for match in trigger.finditer(text):
+        pos = match.start()
+        if pos < end:
+            continue
+        start = 1 + max(
+            text.rfind(" ", end, pos), text.rfind("\n", end, pos)
+        )
+        token_end = RE_TOKEN_END.search(text, pos)
+        stop = token_end.start() if token_end else len(text)
+        pieces.extend((text[end:start], replace(text[start:stop])))
+        end = stop
+
+    if not pieces:
+        return text
+    pieces.append(text[end:])
+    return "".join(pieces)
+
+
+def _replace_urls_and_user_handles(text):
+    return preprocessing.replace_user_handles(preprocessing.replace_urls(text))
+
+
+def _remove_accents(match):
+    return unicodedata.normalize("NFKD", match.group()).translate(
+        _combining_chars_table()
+    )
+
+
+def preprocess_text_fused(
+    text, char_count_filter=True, stopwords=None, min_len=2, max_len=15
+):
+    """
+    Drop-in replacement for ``preprocess_text`` producing identical output
+    with fewer and cheaper full-string passes:
+
+    - steps that cannot match are skipped by cheap guards, e.g. emojis,
+      accents and zero-width spaces in pure ASCII text;
+    - emails, hashtags, URLs and user handles only match within a token, so
+      their regexes run on the tokens containing ``@``, ``#``, ``/`` or
+      ``www`` instead of the whole text;
+    - quotation marks and accents are rewritten only where they occur;
+    - ``remove_punctuation``, ``re.sub``, ``simple_preprocess`` and the
+      stopword filter collapse into one regex scan for runs of ASCII letters
+      (every other character only ever acted as a token separator).
+
+    The textacy steps still run one after the other: each sees the output of
+    the previous one (e.g. ``_NUMBER_`` inside a URL), so a single
+    alternation of their regexes would not give identical output.
+
+    Parameters
+    ----------
+    text : str
+    char_count_filter : bool
+    stopwords : iterable, None
+    min_len : int
+    max_len : int
+
+    Returns
+    -------
+    text : str
+        pre-processed text
+    """
+    if not (char_count_filter & (stopwords is not None)):
+        raise NotImplementedError("Not implemented.")
+
+    # 1) lower case & normalise
+    text = RE_QUOTATION_MARK.sub(_normalize_quotation_mark, text.lower())
+    if RE_HYPHEN_BREAK.search(text):
+        text = RE_HYPHENATED_WORD.sub(r"\1\2", text)
+    text = _normalize_whitespace(text)
+
+    # 2) replace
+    text = preprocessing.replace_currency_symbols(text)
+    text = _replace_tokens(
+        text, RE_EMAIL_TRIGGER, preprocessing.replace_emails
+    )
+    if not text.isascii():
+        text = preprocessing.replace_emojis(text)
+    text = _replace_tokens(
+        text, RE_HASHTAG_TRIGGER, preprocessing.replace_hashtags
+    )
+    text = preprocessing.replace_numbers(text)
+    if RE_PHONE_DIGITS.search(text):
+        text = preprocessing.replace_phone_numbers(text)
+    text = _replace_tokens(
+        text, RE_URL_TRIGGER, _replace_urls_and_user_handles
+    )
+
+    # 3) remove accents
+    if not text.isascii():
+        text = RE_NON_ASCII.sub(_remove_accents, text)
+
+    # 4) tokenise, filter by length and stopwords
+    tokens = (
+        token.lower()
+        for token in RE_ASCII_WORD.findall(text)
+        if min_len <= len(token) <= max_len
+    )
+    return " ".join(token for token in tokens if token not in stopwords)
+
+
+def parse_file_name(file_path):
+    """
+    Extract metadata from a BBC Monitoring file name of the form
+    ``<basin>_<year>.txt`` or ``<basin>_<year>_<month>.txt``.
+
+    Parameters
+    ----------
+    file_path : str
+
+    Returns
+    -------
+    metadata : dict
+        river basin, year and month (NaN if not part of the file name)
+    """
+    fname = file_path.split("/")[-1].split(".")[0].split("_")
+
+    if len(fname) == 2:
+        river_basin, year = fname
+        month = np.nan
+    elif len(fname) == 3:
+        river_basin, year, month = fname
+    else:
+        raise NotImplementedError("Check needed!")
+
+    return {"basin": river_basin, "year": year, "month": month}
+
+
+def split_text(text, chunk_size, separators=("\n\n", "\n", ". ", " ")):
+    """
+    Split text into chunks of at most ``chunk_size`` characters, preferably
+    at paragraph boundaries, then line, sentence and word boundaries. Only
+    a run of ``chunk_size`` characters without any separator is cut hard.
+
+    Parameters
+    ----------
+    text : str
+    chunk_size : int
+        maximum number of characters per chunk
+    separators : tuple
+        boundaries in order of preference
+
+    Returns
+    -------
+    chunks : list
+        ``"".join(chunks) == text``
+    """
+    if len(text) <= chunk_size:
+        return [text]
+
+    separators = [sep for sep in separators if sep in text]
+    if not separators:
+        return [
+            text[i : i + chunk_size] for i in range(0, len(text), chunk_size)
+        ]
+
+    sep, separators = separators[0], tuple(separators[1:])
+    parts = [part + sep for part in text.split(sep)]
+    parts[-1] = parts[-1][: -len(sep)]
+
+    # greedily pack parts into chunks, splitting oversized parts further
+    chunks, current = [], ""
+    for part in parts:
+        if len(current) + len(part) <= chunk_size:
+            current += part
+            continue
+        if current:
+            chunks.append(current)
+        if len(part) <= chunk_size:
+            current = part
+        else:
+            *head, current = split_text(part, chunk_size, separators)
+            chunks.extend(head)
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def iter_split_file(
+    f_input, chunk_size, separators=("\n\n", "\n", ". ", " ")
+):
+    """
+    Read an open text file incrementally and yield chunks of at most
+    ``chunk_size`` characters, see ``split_text``. The file is read in blocks
+    of ``chunk_size`` characters and at most two blocks are held at a time,
+    hence memory is bounded by the chunk size rather than by the file size.
+    Boundaries are chosen within the held blocks, so they can differ from
+    those of ``split_text`` on the whole text.
+
+    Parameters
+    ----------
+    f_input : file object
+    chunk_size : int
+    separators : tuple
+
+    Yields
+    ------
+    chunk : str
+        ``"".join(chunks) == f_input.read()``
+    """
+    tail = ""
+    while True:
+        block = f_input.read(chunk_size)
+        if not block:
+            break
+
+        # the last chunk may continue in the next block
+        *chunks, tail = split_text(tail + block, chunk_size, separators)
+        yield from chunks
+
+    if tail:
+        yield tail
+
+
+def iter_raw_records(file_path, chunk_size=None):
+    """
+    Raw text and metadata of a single raw text file.
+
+    Parameters
+    ----------
+    file_path : str
+    chunk_size : int, None
+        If given, the file is read incrementally and split into chunks of
+        at most ``chunk_size`` characters (see ``iter_split_file``). Each
+        chunk carries the metadata of the file plus its position ``chunk``.
+
+    Yields
+    ------
+    record : tuple
+        (raw text, metadata) per chunk, a single record if ``chunk_size``
+        is None
+    """
+    metadata = parse_file_name(file_path)
+
+    with open(file_path) as f_input:
+        if chunk_size is None:
+            yield f_input.read(), metadata
+            return
+
+        for i, chunk in enumerate(iter_split_file(f_input, chunk_size)):
+            yield chunk, dict(metadata, chunk=i)
+
+
+def preprocess_record(record, specific_stopwords=None):
+    """
+    Pre-process the text of a (raw text, metadata) record, see
+    ``iter_raw_records``. Defined at module level so that it can be shipped
+    to a pool of worker processes.
+
+    Returns
+    -------
+    record : tuple
+        (pre-processed text, metadata)
+    """
+    text, metadata = record
+
+    # fused equivalent of preprocess_text
+    text = preprocess_text_fused(
+        text,
+        char_count_filter=True,
+        stopwords=specific_stopwords,
+        min_len=3,
+        max_len=15,
+    )
+    return text, metadata
+
+
+def read_file(file_path, specific_stopwords=None, chunk_size=None):
+    """
+    Read and pre-process a single raw text file, lazily, chunk by chunk.
+
+    Parameters
+    ----------
+    file_path : str
+    specific_stopwords : iterable, None
+    chunk_size : int, None
+        see ``iter_raw_records``
+
+    Yields
+    ------
+    record : tuple
+        (pre-processed text, metadata) per chunk, a single record if
+        ``chunk_size`` is None
+    """
+    for record in iter_raw_records(file_path, chunk_size=chunk_size):
+        yield preprocess_record(record, specific_stopwords=specific_stopwords)
+
+
+# spaCy model packages per backend, only the requested one is loaded by
+# load_nlp. Downstream feature extraction only needs lemmas, POS tags and
+# stop flags; "lean" provides them via en_core_web_sm's tagger without
+# loading en_core_web_lg's large vector table.
+NLP_BACKENDS = {"full": "en_core_web_lg", "lean": "en_core_web_sm"}
+
+
+def load_nlp(backend="full", max_length=int(30 * 1e6)):
+    """
+    Load and configure the spaCy nlp pipeline used for corpus creation.
+    https://stackoverflow.com/questions/52557058/spacy-nlp-pipeline-order-of-operations
+
+    Parameters
+    ----------
+    backend : str
+        {"full", "lean"}, see ``NLP_BACKENDS``. Use
+        ``benchmark.compare_nlp_backends`` to report the differences of the
+        resulting term lists.
+    max_length : int, None
+        maximum number of characters per doc, spaCy's default if None. Not
+        needed if files are processed in chunks.
+
+    Returns
+    -------
+    nlp : spaCy
+    """
+    if backend not in NLP_BACKENDS:
+        raise ValueError(
+            "backend must be one of {}, got {!r}".format(
+                sorted(NLP_BACKENDS), backend
+            )
+        )
+
+    # parser and ner are never loaded
+    nlp = spacy.load(NLP_BACKENDS[backend], disable=["parser", "ner"])
+    if max_length is not None:
+        nlp.max_length = max_length
+    return nlp
+
+
+def _imap_bounded(pool, func, iterable, max_in_flight):
+    # as pool.imap, but a task is only submitted once the consumer has taken
+    # a result, so at most max_in_flight results are ever pending
+    pending = collections.deque()
+    for item in iterable:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def process_files(
+    file_list,
+    nlp,
+    specific_stopwords=None,
+    n_process=1,
+    batch_size=8,
+    chunk_size=None,
+):
+    """
+    Read, pre-process and parse raw text files into spaCy docs with metadata.
+
+    Parameters
+    ----------
+    file_list : list
+        file paths, docs are yielded in this order
+    nlp : spaCy
+        NLP pipeline
+    specific_stopwords : iterable, None
+    n_process : int
+        Total number of processes. About a quarter of them pre-process files
+        (or chunks) in a pool, the others parse with spaCy's ``nlp.pipe``.
+        At most two pre-processed records per pool worker wait for the
+        parser, hence memory stays flat. Results are taken in input order,
+        hence the order of documents is independent of the number of
+        processes.
+    batch_size : int
+        Number of documents per ``nlp.pipe`` batch.
+    chunk_size : int, None
+        If given, files are split into chunks of at most ``chunk_size``
+        characters which are parsed as separate docs, in file order.
+
+    Yields
+    ------
+    doc : spacy.tokens.Doc
+    """
+    # raw files are read in the main process, chunk by chunk
+    raw_records = itertools.chain.from_iterable(
+        iter_raw_records(file_path, chunk_size=chunk_size)
+        for file_path in file_list
+    )
+    preprocess_func = functools.partial(
+        preprocess_record, specific_stopwords=specific_stopwords
+    )
+
+    if n_process > 1:
+        # parsing dominates, pre-processing gets the smaller share
+        n_preprocess = max(1, n_process // 4)
+        n_process = max(1, n_process - n_preprocess)
+        pool = multiprocessing.Pool(processes=n_preprocess)
+        records = _imap_bounded(
+            pool, preprocess_func, raw_records, max_in_flight=2 * n_preprocess
+        )
+    else:
+        pool = None
+        records = map(preprocess_func, raw_records)
+
+    try:
+        for doc, metadata in tqdm(
+            nlp.pipe(
+                records,
+                as_tuples=True,
+                batch_size=batch_size,
+                n_process=n_process,
+            ),
+            total=len(file_list) if chunk_size is None else None,
+        ):
+            doc._.meta = metadata
+            yield doc
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
 def create_corpus(
     input_filepath,
     output_filepath,
     nlp=None,
     specific_stopwords=None,
     return_data=False,
+    n_process=1,
+    batch_size=8,
+    shard_size=None,
+    chunk_size=None,
+    indexed=False,
 ):
     """
     Runs data processing scripts to turn raw data from (../raw) into
@@ -92,7 +595,8 @@ def create_corpus(
         Folder path storing un-mutable raw data. Use a wildcard within the
          file name to filter files via glob.glob.
     output_filepath : str
-        File path where corpus should be saved.
+        File path where corpus should be saved. Directory of the shards if
+        ``shard_size`` is given, of the indexed corpus if ``indexed``.
     nlp : spaCy
         NLP pipeline
     specific_stopwords : iterable, None
@@ -102,6 +606,29 @@ def create_corpus(
         True if corpus should be saved, else otherwise.
     return_data : bool
         whether to keep corpus in memory
+    n_process : int
+        Number of worker processes used for pre-processing and for spaCy's
+        ``nlp.pipe``. Documents keep the (sorted) order of the input files,
+        so the corpus is identical to the one built with ``n_process=1``.
+    batch_size : int
+        Number of documents per ``nlp.pipe`` batch. Keep this small, single
+        documents can be tens of MB.
+    shard_size : int, None
+        If given, stream each doc to disk as soon as it is processed, in
+        gzipped shards of ``shard_size`` docs (see ``io.CorpusShardWriter``).
+        Memory then stays flat regardless of the number of input files.
+    chunk_size : int, None
+        If given, split raw files into chunks of at most ``chunk_size``
+        characters at paragraph or sentence boundaries and parse each chunk
+        as a separate doc tagged with the file's metadata, instead of
+        raising ``nlp.max_length``. Peak memory is then bounded by the chunk
+        size rather than by the largest file.
+    indexed : bool
+        If True, stream docs to an indexed corpus (see
+        ``io.IndexedCorpusWriter``) that can be read lazily, per doc, with
+        a metadata index for queries such as
+        ``corpus.query(basin="Nile", year=(1990, 2000))``. Exclusive with
+        ``shard_size``.
 
     Returns
     -------
@@ -112,64 +639,63 @@ def create_corpus(
     logger = logging.getLogger(__name__)
     logger.info("Creating corpus from raw BBC Monitoring data")
 
+    if indexed and shard_size is not None:
+        raise ValueError("indexed and shard_size are exclusive")
+
     # load and configure spacy nlp model
-    # https://stackoverflow.com/questions/52557058/spacy-nlp-pipeline-order-of-operations
     # -------------------------------------------------------------------------
     if nlp is None:
-        nlp = en_core_web_lg.load()
-        nlp.max_length = int(30 * 1e6)
-        nlp.remove_pipe("parser")
-        nlp.remove_pipe("ner")
+        nlp = load_nlp(max_length=None if chunk_size else int(30 * 1e6))
 
     # compile list of documents (slower, but more robust than os.listdir)
     # -------------------------------------------------------------------------
     file_list = glob.glob(input_filepath)
     file_list = sorted(file_list)
 
-    # iteratively read in text stream
+    # create docs with metadata via batched nlp pipeline
     # -------------------------------------------------------------------------
-    records = []
-    for file_path in tqdm(file_list):
-
-        # extract metadata of file name
-        # ---------------------------------------------------------------------
-        fname = file_path.split("/")[-1].split(".")[0].split("_")
-
-        if len(fname) == 2:
-            river_basin, year = fname
-            month = np.nan
-        elif len(fname) == 3:
-            river_basin, year, month = fname
-        else:
-            raise NotImplementedError("Check needed!")
-
-        metadata = {"basin": river_basin, "year": year, "month": month}
-
-        # read and pre-process with nlp pipeline
-        # ---------------------------------------------------------------------
-        with open(file_path) as f_input:
-            # 1) read raw text file
-            text_raw = f_input.read()
-
-            # 2) pre-process with utils (textacy only, or textacy & gensim)
-            text = preprocess_text(
-                text_raw,
-                char_count_filter=True,
-                stopwords=specific_stopwords,
-                min_len=3,
-                max_len=15,
-            )
-
-            # 3) create doc with metadata
-            doc = textacy.make_spacy_doc(data=(text, metadata), lang=nlp)
-
-            # 4) append record
-            records.append(doc)
+    docs = process_files(
+        file_list,
+        nlp=nlp,
+        specific_stopwords=specific_stopwords,
+        n_process=n_process,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+    )
 
     # build corpus
     # ---------------------------------------------------------------------
-    corpus = textacy.Corpus(nlp, data=records)
-    corpus.save(output_filepath)
+    if indexed:
+        with io.IndexedCorpusWriter(dirpath=output_filepath) as writer:
+            for doc in docs:
+                writer.add(doc)
+
+        logger.info("Wrote {} indexed docs.".format(writer.n_docs))
+
+        # docs are only decoded on access
+        corpus = io.IndexedCorpus(output_filepath, language_model=nlp)
+    elif shard_size is None:
+        corpus = textacy.Corpus(nlp, data=docs)
+        corpus.save(output_filepath)
+    else:
+        with io.CorpusShardWriter(
+            dirpath=output_filepath, shard_size=shard_size
+        ) as writer:
+            for doc in docs:
+                writer.add(doc)
+
+        logger.info(
+            "Wrote {} docs to {} shards.".format(
+                writer.n_docs, writer.n_shards
+            )
+        )
+
+        # corpus is only materialised on demand
+        corpus = None
+        if return_data:
+            corpus = io.read_corpus_shards(
+                dirpath=output_filepath, language_model=nlp
+            )
 
     # optionally keep corpus in memory
     if return_data:
@@ -178,6 +704,186 @@ def create_corpus(
         return None
 
 
+def metadata_key(metadata):
+    """
+    Unique key of a raw file, built from its metadata. Inverse of
+    ``parse_file_name`` (month is NaN for yearly files).
+
+    Parameters
+    ----------
+    metadata : dict
+
+    Returns
+    -------
+    str
+    """
+    parts = [metadata["basin"], metadata["year"]]
+    if isinstance(metadata["month"], str):
+        parts.append(metadata["month"])
+    return "_".join(parts)
+
+
+def manifest_filepath(corpus_filepath):
+    """
+    File path of the manifest that belongs to a corpus file, e.g.
+    ``<name>.bin.gz`` -> ``<name>_MANIFEST.json``.
+    """
+    fpath = re.sub(r"(\.bin)?(\.gz)?$", "", corpus_filepath)
+    return fpath + "_MANIFEST.json"
+
+
+def update_corpus(
+    input_filepath,
+    output_filepath,
+    nlp=None,
+    specific_stopwords=None,
+    return_data=False,
+    n_process=1,
+    batch_size=8,
+    chunk_size=None,
+    indexed=False,
+):
+    """
+    Incrementally update a corpus. A manifest of the content hashes of all
+    input files is kept next to the corpus (files whose size and
+    modification time are unchanged are not hashed again, see
+    ``cache.hash_files``); only new or changed files are
+    pre-processed and parsed, docs of changed or deleted files are dropped
+    and the result is merged into the existing corpus in file order. Falls
+    back to a full build if the corpus or its manifest does not exist yet,
+    or if the corpus is not of the format requested by ``indexed``.
+
+    Parameters
+    ----------
+    input_filepath : str
+        Folder path storing un-mutable raw data. Use a wildcard within the
+         file name to filter files via glob.glob.
+    output_filepath : str
+        File path of the corpus, directory of the indexed corpus if
+        ``indexed``.
+    nlp : spaCy
+        NLP pipeline
+    specific_stopwords : iterable, None
+    return_data : bool
+        whether to keep corpus in memory
+    n_process : int
+    batch_size : int
+    chunk_size : int, None
+        see ``create_corpus``
+    indexed : bool
+        keep the corpus as an indexed corpus, see ``create_corpus``; kept
+        and new docs are then streamed to disk without being materialised
+
+    Returns
+    -------
+    corpus: textacy.Corpus, io.IndexedCorpus
+    """
+    logger = logging.getLogger(__name__)
+
+    if nlp is None:
+        nlp = load_nlp(max_length=None if chunk_size else int(30 * 1e6))
+
+    fpath_manifest = manifest_filepath(output_filepath)
+    if (
+        os.path.exists(output_filepath)
+        and os.path.isdir(output_filepath) == indexed
+        and os.path.exists(fpath_manifest)
+    ):
+        with open(fpath_manifest) as f:
+            manifest_old = json.load(f)
+    else:
+        manifest_old = {}
+
+    # earlier manifests only store the content hash
+    manifest_old = {
+        key: entry if isinstance(entry, dict) else {"sha256": entry}
+        for key, entry in manifest_old.items()
+    }
+
+    # only files with a new size or modification time are hashed
+    file_list = sorted(glob.glob(input_filepath))
+    file_keys = [metadata_key(parse_file_name(fp)) for fp in file_list]
+    manifest = cache.hash_files(
+        dict(zip(file_keys, file_list)), previous=manifest_old
+    )
+
+    # files to (re-)process and docs to drop from the existing corpus
+    digests = {key: entry["sha256"] for key, entry in manifest.items()}
+    digests_old = {key: entry["sha256"] for key, entry in manifest_old.items()}
+    changed = [
+        fp
+        for key, fp in zip(file_keys, file_list)
+        if digests_old.get(key) != digests[key]
+    ]
+    stale = {
+        key
+        for key, digest in digests_old.items()
+        if digests.get(key) != digest
+    }
+
+    logger.info(
+        "Updating corpus: {} new or changed, {} stale of {} files.".format(
+            len(changed), len(stale), len(file_list)
+        )
+    )
+
+    if not manifest_old:
+        corpus = create_corpus(
+            input_filepath=input_filepath,
+            output_filepath=output_filepath,
+            nlp=nlp,
+            specific_stopwords=specific_stopwords,
+            return_data=True,
+            n_process=n_process,
+            batch_size=batch_size,
+            chunk_size=chunk_size,
+            indexed=indexed,
+        )
+    elif changed or stale:
+        corpus = io.read_corpus(fpath=output_filepath, language_model=nlp)
+        kept = (
+            doc for doc in corpus if metadata_key(doc._.meta) not in stale
+        )
+        new = process_files(
+            changed,
+            nlp=nlp,
+            specific_stopwords=specific_stopwords,
+            n_process=n_process,
+            batch_size=batch_size,
+            chunk_size=chunk_size,
+        )
+
+        # both streams are in file order, the merge keeps chunks in order
+        position = {key: i for i, key in enumerate(file_keys)}
+        docs = heapq.merge(
+            kept, new, key=lambda doc: position[metadata_key(doc._.meta)]
+        )
+
+        if indexed:
+            # the old corpus is unmapped once the new one has replaced it
+            with corpus:
+                with io.IndexedCorpusWriter(dirpath=output_filepath) as writer:
+                    for doc in docs:
+                        writer.add(doc)
+            corpus = io.IndexedCorpus(output_filepath, language_model=nlp)
+        else:
+            corpus = textacy.Corpus(nlp, data=docs)
+            corpus.save(output_filepath)
+    else:
+        corpus = None
+        if return_data:
+            corpus = io.read_corpus(fpath=output_filepath, language_model=nlp)
+
+    # write manifest only after the corpus has been saved
+    with open(fpath_manifest, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    if return_data:
+        return corpus
+    else:
+        return None
+
+
 if __name__ == "__main__":
     log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     logging.basicConfig(level=logging.INFO, format=log_fmt)
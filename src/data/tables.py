@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Parquet tables of term statistics and vocabularies. Kept apart from
+``src.data.io`` so that reading and plotting cached tables does not import
+spaCy, textacy or scikit-learn.
+"""
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def write_table(df, fpath, index="term", row_group_size=10000):
+    """
+    Write a DataFrame as Parquet, a columnar format independent of Python
+    and pandas versions that ``read_table`` can read in parts. Rows are
+    stored in order in row groups of ``row_group_size``, hence top-N slices
+    of tables sorted before writing only read the first row groups.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+    fpath : str
+        written atomically
+    index : str, None
+        column name of the index, dropped if None
+    row_group_size : int
+    """
+    df = df.rename_axis(index).reset_index() if index else df
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, fpath + ".tmp", row_group_size=row_group_size)
+    os.replace(fpath + ".tmp", fpath)
+
+
+def read_table(fpath, columns=None, filters=None, n=None, index="term"):
+    """
+    Read (parts of) a table written by ``write_table``. Only the requested
+    columns are read; ``filters`` are pushed down to skip row groups by
+    their statistics and ``n`` stops after the first ``n`` rows.
+
+    Parameters
+    ----------
+    fpath : str
+    columns : list, None
+        columns besides the index, all if None
+    filters : list, None
+        e.g. ``[("count", ">=", 100)]``, see ``pyarrow.parquet.read_table``
+    n : int, None
+        number of leading rows, exclusive with ``filters``
+    index : str, None
+        column to use as (unnamed) index
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if columns is not None and index:
+        columns = [index] + [column for column in columns if column != index]
+
+    if n is None:
+        table = pq.read_table(fpath, columns=columns, filters=filters)
+    elif filters is not None:
+        raise ValueError("n and filters are exclusive")
+    else:
+        parquet_file = pq.ParquetFile(fpath)
+        tables, n_rows = [], 0
+        for i in range(parquet_file.num_row_groups):
+            if n_rows >= n:
+                break
+            tables.append(parquet_file.read_row_group(i, columns=columns))
+            n_rows += tables[-1].num_rows
+        if tables:
+            table = pa.concat_tables(tables).slice(0, n)
+        else:
+            # n == 0 or no row groups, only the schema is read
+            table = parquet_file.schema_arrow.empty_table()
+            if columns is not None:
+                table = table.select(columns)
+
+    df = table.to_pandas()
+    if index:
+        df = df.set_index(index).rename_axis(None)
+
+    return df
+
+
+def read_word_counts(fpath, columns=None, filters=None, n=None):
+    """
+    Word counts of ``visualize.word_counts`` (count, freq) by term, sorted
+    by count, see ``read_table``.
+    """
+    return read_table(fpath, columns=columns, filters=filters, n=n)
+
+
+def read_word_document_counts(fpath, columns=None, filters=None, n=None):
+    """
+    Word-document counts of ``visualize.word_document_counts`` (count,
+    freq, idf) by term, sorted by count, see ``read_table``.
+    """
+    return read_table(fpath, columns=columns, filters=filters, n=n)
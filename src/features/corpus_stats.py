@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import math
+import shutil
+import logging
+import collections
+from array import array
+import numpy as np
+import scipy.sparse as sp
+import pandas as pd
+
+# doc._.meta fields of the groups of GroupedTermStats
+GROUP_KEYS = ("basin", "year", "month")
+
+
+def parent_file_key(meta):
+    """
+    Key of the raw file a chunked doc stems from, None for unchunked docs.
+    """
+    if "chunk" not in meta:
+        return None
+    return meta["basin"], meta["year"], str(meta["month"])
+
+
+def iter_file_docs(corpus):
+    """
+    Group the docs of a corpus by raw file: consecutive chunks of the same
+    file (docs whose metadata contains a ``chunk`` position, see
+    ``make_corpus.split_text``) form one group, any other doc its own.
+
+    Parameters
+    ----------
+    corpus : iterable
+        spaCy docs
+
+    Yields
+    ------
+    docs : list
+        spaCy docs of one raw file
+    """
+    docs, key = [], None
+    for doc in corpus:
+        meta = doc._.meta
+        doc_key = parent_file_key(meta)
+        if docs and (doc_key is None or doc_key != key or meta["chunk"] == 0):
+            yield docs
+            docs = []
+        docs.append(doc)
+        key = doc_key
+
+    if docs:
+        yield docs
+
+
+def _file_bag_of_words(docs, **kwargs):
+    # term counts of the docs of one raw file, see iter_file_docs
+    if len(docs) == 1:
+        return docs[0]._.to_bag_of_words(weighting="count", **kwargs)
+
+    bag_of_words = collections.Counter()
+    for doc in docs:
+        bag_of_words.update(
+            doc._.to_bag_of_words(weighting="count", **kwargs)
+        )
+    return bag_of_words
+
+
+def corpus_statistics(
+    corpus,
+    normalize="lemma",
+    filter_stops=True,
+    filter_punct=True,
+    filter_nums=True,
+):
+    """
+    Term statistics of a corpus in a single pass over its docs, equal to
+    those of textacy's ``Corpus.word_counts`` and ``Corpus.word_doc_counts``
+    with the same filters, each of which walks all tokens once per
+    weighting. The chunks of a raw file count as one doc, see
+    ``iter_file_docs``.
+
+    Parameters
+    ----------
+    corpus : iterable
+        spaCy docs, e.g. a textacy.Corpus
+    normalize : str
+    filter_stops : bool
+    filter_punct : bool
+    filter_nums : bool
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by term, in order of first occurrence, with columns
+
+        - ``count``: occurrences of the term
+        - ``freq``: ``count`` per token of the corpus
+        - ``doc_count``: docs containing the term
+        - ``doc_freq``: ``doc_count`` per doc
+        - ``idf``: smoothed idf, ``log(1 + n_docs / doc_count)``
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Computing corpus statistics.")
+
+    counts = collections.Counter()
+    doc_counts = collections.Counter()
+    n_docs, n_tokens = 0, 0
+
+    for docs in iter_file_docs(corpus):
+        bag_of_words = _file_bag_of_words(
+            docs,
+            normalize=normalize,
+            as_strings=True,
+            filter_stops=filter_stops,
+            filter_punct=filter_punct,
+            filter_nums=filter_nums,
+        )
+        counts.update(bag_of_words)
+        doc_counts.update(bag_of_words.keys())
+        n_docs += 1
+        n_tokens += sum(len(doc) for doc in docs)
+
+    terms = list(counts)
+    return _statistics_table(
+        terms,
+        [counts[term] for term in terms],
+        [doc_counts[term] for term in terms],
+        n_docs,
+        n_tokens,
+    )
+
+
+def _statistics_table(terms, counts, doc_counts, n_docs, n_tokens):
+    # columns of corpus_statistics
+    df_stats = pd.DataFrame(
+        {"count": counts, "doc_count": doc_counts}, index=terms, dtype="int64"
+    )
+    df_stats["freq"] = df_stats["count"] / n_tokens
+    df_stats["doc_freq"] = df_stats["doc_count"] / n_docs
+    df_stats["idf"] = [
+        math.log(1 + (n_docs / doc_count))
+        for doc_count in df_stats["doc_count"]
+    ]
+
+    return df_stats[["count", "freq", "doc_count", "doc_freq", "idf"]]
+
+
+class GroupedTermStats:
+    """
+    Term counts and doc counts per group of docs, e.g. per (basin, year,
+    month), as sparse ``(n_groups, n_terms)`` matrices. Groups can be
+    selected and aggregated without touching the docs again; the statistics
+    of any selection are then derived as in ``corpus_statistics``.
+
+    Parameters
+    ----------
+    counts : scipy.sparse.spmatrix
+        occurrences of term j in the docs of group i
+    doc_counts : scipy.sparse.spmatrix
+        docs of group i containing term j
+    groups : pd.DataFrame
+        group labels plus ``n_docs`` and ``n_tokens`` per group
+    terms : iterable
+        term of each column
+    """
+
+    def __init__(self, counts, doc_counts, groups, terms):
+        self.counts = sp.csr_matrix(counts, dtype=np.int64)
+        self.doc_counts = sp.csr_matrix(doc_counts, dtype=np.int64)
+        self.groups = groups.reset_index(drop=True)
+        self.terms = pd.Index(terms)
+
+    @property
+    def group_keys(self):
+        return [
+            key for key in self.groups if key not in ("n_docs", "n_tokens")
+        ]
+
+    def select(self, **labels):
+        """
+        Groups matching all given labels, e.g. ``select(basin="Nile",
+        year=["2001", "2002"])``; lists match any of their values.
+
+        Returns
+        -------
+        GroupedTermStats
+        """
+        mask = np.ones(len(self.groups), dtype=bool)
+        for key, value in labels.items():
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+            mask &= self.groups[key].isin(value).to_numpy()
+
+        index = np.flatnonzero(mask)
+        return GroupedTermStats(
+            self.counts[index],
+            self.doc_counts[index],
+            self.groups.iloc[index],
+            self.terms,
+        )
+
+    def aggregate(self, by=()):
+        """
+        Sum the statistics of all groups sharing the labels ``by``, e.g.
+        ``aggregate(by=["basin"])`` for per-basin statistics; ``by=()``
+        merges all groups into one.
+
+        Returns
+        -------
+        GroupedTermStats
+        """
+        by = list(by)
+        if by:
+            grouped = self.groups.groupby(by, sort=True, dropna=False)
+            codes = grouped.ngroup().to_numpy()
+            groups = grouped[["n_docs", "n_tokens"]].sum().reset_index()
+        else:
+            codes = np.zeros(len(self.groups), dtype=np.int64)
+            groups = self.groups[["n_docs", "n_tokens"]].sum().to_frame().T
+
+        # (n_new_groups, n_groups) indicator of the new group of each group
+        indicator = sp.csr_matrix(
+            (
+                np.ones(len(codes), dtype=np.int64),
+                (codes, np.arange(len(codes))),
+            ),
+            shape=(len(groups), len(codes)),
+        )
+        return GroupedTermStats(
+            indicator @ self.counts,
+            indicator @ self.doc_counts,
+            groups,
+            self.terms,
+        )
+
+    def table(self):
+        """
+        Statistics of all groups taken together, in the format of
+        ``corpus_statistics``; terms not occurring are dropped.
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        counts = np.asarray(self.counts.sum(axis=0)).ravel()
+        doc_counts = np.asarray(self.doc_counts.sum(axis=0)).ravel()
+        index = np.flatnonzero(counts)
+
+        return _statistics_table(
+            self.terms[index],
+            counts[index],
+            doc_counts[index],
+            int(self.groups["n_docs"].sum()),
+            int(self.groups["n_tokens"].sum()),
+        )
+
+    def top_terms(self, n=10, by="count"):
+        """
+        ``n`` terms with the highest ``by`` per group.
+
+        Parameters
+        ----------
+        n : int
+        by : str
+            {"count", "freq", "doc_count", "doc_freq"}
+
+        Returns
+        -------
+        pd.DataFrame
+            long format, one row per group and term
+        """
+        matrix = self.doc_counts if by.startswith("doc") else self.counts
+        norm = "n_docs" if by.startswith("doc") else "n_tokens"
+
+        rows = []
+        for i, group in enumerate(self.groups.to_dict("records")):
+            row = matrix.getrow(i)
+            order = np.argsort(-row.data, kind="stable")[:n]
+            for rank, j in enumerate(order):
+                value = row.data[j]
+                if by.endswith("freq"):
+                    value = value / group[norm]
+                rows.append(
+                    {
+                        **{key: group[key] for key in self.group_keys},
+                        "rank": rank + 1,
+                        "term": self.terms[row.indices[j]],
+                        by: value,
+                    }
+                )
+
+        return pd.DataFrame(rows)
+
+
+def grouped_corpus_statistics(
+    corpus,
+    group_keys=GROUP_KEYS,
+    normalize="lemma",
+    filter_stops=True,
+    filter_punct=True,
+    filter_nums=True,
+):
+    """
+    Term counts and doc counts per group of docs with the same
+    ``doc._.meta`` labels (see ``make_corpus.parse_file_name``), in a single
+    pass over the corpus. Terms and filters are those of
+    ``corpus_statistics``, which equals ``.aggregate().table()`` of the
+    result; the chunks of a raw file count as one doc. Missing months (NaN)
+    form their own group, labelled None.
+
+    Parameters
+    ----------
+    corpus : iterable
+        spaCy docs
+    group_keys : tuple
+        metadata fields defining the groups
+    normalize : str
+    filter_stops : bool
+    filter_punct : bool
+    filter_nums : bool
+
+    Returns
+    -------
+    GroupedTermStats
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Computing grouped corpus statistics.")
+
+    # ids in order of first occurrence
+    vocabulary = collections.defaultdict()
+    vocabulary.default_factory = vocabulary.__len__
+    group_ids = collections.defaultdict()
+    group_ids.default_factory = group_ids.__len__
+    n_docs, n_tokens = array("q"), array("q")
+
+    # one entry per (doc, term)
+    rows, cols, values = array("q"), array("q"), array("q")
+
+    for docs in iter_file_docs(corpus):
+        meta = docs[0]._.meta
+        labels = tuple(
+            None if pd.isna(meta[key]) else meta[key] for key in group_keys
+        )
+        group_id = group_ids[labels]
+        if group_id == len(n_docs):
+            n_docs.append(0)
+            n_tokens.append(0)
+        n_docs[group_id] += 1
+        n_tokens[group_id] += sum(len(doc) for doc in docs)
+
+        bag_of_words = _file_bag_of_words(
+            docs,
+            normalize=normalize,
+            as_strings=True,
+            filter_stops=filter_stops,
+            filter_punct=filter_punct,
+            filter_nums=filter_nums,
+        )
+        cols.extend(vocabulary[term] for term in bag_of_words)
+        values.extend(bag_of_words.values())
+        rows.extend([group_id] * len(bag_of_words))
+
+    rows = np.frombuffer(rows, dtype=np.int64)
+    cols = np.frombuffer(cols, dtype=np.int64)
+    values = np.frombuffer(values, dtype=np.int64)
+    shape = (len(group_ids), len(vocabulary))
+
+    # duplicate (group, term) entries are summed
+    counts = sp.csr_matrix((values, (rows, cols)), shape=shape)
+    doc_counts = sp.csr_matrix(
+        (np.ones(len(values), dtype=np.int64), (rows, cols)), shape=shape
+    )
+
+    groups = pd.DataFrame(list(group_ids), columns=list(group_keys))
+    groups["n_docs"] = np.frombuffer(n_docs, dtype=np.int64)
+    groups["n_tokens"] = np.frombuffer(n_tokens, dtype=np.int64)
+
+    return GroupedTermStats(
+        counts, doc_counts, groups, sorted(vocabulary, key=vocabulary.get)
+    )
+
+
+def write_grouped_statistics(stats, dirpath):
+    """
+    Persist a GroupedTermStats, to be read with ``read_grouped_statistics``.
+
+    Layout of ``dirpath``:
+
+    - ``counts.npz``, ``doc_counts.npz``: sparse (n_groups, n_terms)
+    - ``groups.json``: group labels, ``n_docs`` and ``n_tokens`` per group
+    - ``terms.json``: list of terms, the position is the column
+
+    Parameters
+    ----------
+    stats : GroupedTermStats
+    dirpath : str
+        output directory, written atomically
+    """
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    sp.save_npz(os.path.join(tmp_dirpath, "counts.npz"), stats.counts)
+    sp.save_npz(os.path.join(tmp_dirpath, "doc_counts.npz"), stats.doc_counts)
+    with open(os.path.join(tmp_dirpath, "groups.json"), "w") as f:
+        json.dump(
+            stats.groups.astype(object)
+            .where(stats.groups.notna(), None)
+            .to_dict("list"),
+            f,
+        )
+    with open(os.path.join(tmp_dirpath, "terms.json"), "w") as f:
+        json.dump(list(stats.terms), f)
+
+    shutil.rmtree(dirpath, ignore_errors=True)
+    os.replace(tmp_dirpath, dirpath)
+
+
+def read_grouped_statistics(dirpath):
+    """
+    Read grouped term statistics written by ``write_grouped_statistics``.
+
+    Returns
+    -------
+    GroupedTermStats
+    """
+    with open(os.path.join(dirpath, "groups.json")) as f:
+        groups = pd.DataFrame(json.load(f))
+    with open(os.path.join(dirpath, "terms.json")) as f:
+        terms = json.load(f)
+
+    return GroupedTermStats(
+        counts=sp.load_npz(os.path.join(dirpath, "counts.npz")),
+        doc_counts=sp.load_npz(os.path.join(dirpath, "doc_counts.npz")),
+        groups=groups,
+        terms=terms,
+    )
@@ -1,6 +1,141 @@
 # -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import operator
+import itertools
+import functools
+import collections
+import multiprocessing
+from array import array
+import numpy as np
+import spacy
 import textacy
 import textacy.vsm
+from src.data import io
+from src.features import corpus_stats
+
+# vocabulary of a term extraction worker process, see _init_worker
+_WORKER_VOCAB = None
+
+
+def _term_normalizer(normalize):
+    # normalize callable for to_terms_list returning the key textacy's
+    # min_freq counts, i.e. n-gram size and lower-cased text, with the term
+    if normalize == "lemma":
+        get_term = operator.attrgetter("lemma_")
+    elif normalize == "lower":
+        get_term = operator.attrgetter("lower_")
+    elif callable(normalize):
+        get_term = normalize
+    else:
+        get_term = operator.attrgetter("text")
+
+    def normalizer(term):
+        n = 1 if isinstance(term, spacy.tokens.Token) else len(term)
+        return (n, term.lower_), get_term(term)
+
+    return normalizer
+
+
+def _file_terms_list(docs, min_freq, normalize, as_strings, **kwargs):
+    # terms list of the chunks of a raw file, as if they were a single doc
+    keyed_terms = [
+        keyed_term
+        for doc in docs
+        for keyed_term in doc._.to_terms_list(
+            normalize=_term_normalizer(normalize),
+            as_strings=True,
+            min_freq=1,
+            **kwargs
+        )
+    ]
+    freqs = collections.Counter(key for key, _ in keyed_terms)
+    terms = [term for key, term in keyed_terms if freqs[key] >= min_freq]
+
+    if not as_strings:
+        strings = docs[0].vocab.strings
+        terms = [strings.add(term) for term in terms]
+    return terms
+
+
+def iter_doc_terms(
+    corpus, min_freq=2, normalize="lemma", as_strings=False, **kwargs
+):
+    """
+    Yield the terms list and metadata of each raw file in a corpus.
+
+    Consecutive chunks of the same raw file (see
+    ``corpus_stats.iter_file_docs``) are merged into one terms list, with
+    ``min_freq`` applied to the merged list rather than per chunk; as in
+    textacy, it counts the lower-cased text of the terms per n-gram size.
+    Compared to parsing the file as a single doc, only n-grams spanning a
+    chunk boundary are lost.
+
+    Parameters
+    ----------
+    corpus : iterable
+        spaCy docs
+    min_freq : int
+    normalize : str, callable, None
+    as_strings : bool
+    kwargs
+        passed on to ``doc._.to_terms_list``
+
+    Yields
+    ------
+    (terms, metadata) : tuple
+        metadata of the file's first chunk
+    """
+    for docs in corpus_stats.iter_file_docs(corpus):
+        if len(docs) == 1:
+            terms = docs[0]._.to_terms_list(
+                min_freq=min_freq,
+                normalize=normalize,
+                as_strings=as_strings,
+                **kwargs
+            )
+        else:
+            terms = _file_terms_list(
+                docs, min_freq, normalize, as_strings, **kwargs
+            )
+        yield terms, docs[0]._.meta
+
+
+def _iter_doc_batches(corpus, batch_size):
+    # serialise docs in batches of about batch_size, never splitting the
+    # chunks of a raw file across batches
+    doc_bin = None
+    for docs in corpus_stats.iter_file_docs(corpus):
+        if doc_bin is None:
+            doc_bin = spacy.tokens.DocBin(
+                attrs=io.DOCBIN_ATTRS, store_user_data=True
+            )
+        for doc in docs:
+            doc_bin.add(doc)
+        if len(doc_bin) >= batch_size:
+            yield doc_bin.to_bytes()
+            doc_bin = None
+
+    if doc_bin is not None:
+        yield doc_bin.to_bytes()
+
+
+def _init_worker(lang):
+    global _WORKER_VOCAB
+    _WORKER_VOCAB = spacy.blank(lang).vocab
+
+
+def _extract_batch(doc_bin_bytes, **kwargs):
+    docs = (
+        spacy.tokens.DocBin(store_user_data=True)
+        .from_bytes(doc_bin_bytes)
+        .get_docs(_WORKER_VOCAB)
+    )
+    return [
+        (list(terms), meta["basin"], meta["year"])
+        for terms, meta in iter_doc_terms(docs, **kwargs)
+    ]
 
 
 def tokenize_corpus(
@@ -13,23 +148,122 @@ def tokenize_corpus(
     filter_nums=True,
     include_pos={"ADJ", "NOUN", "VERB"},
     min_freq=2,
+    n_process=1,
+    batch_size=16,
 ):
-    tokenized_docs, basin_group, year_group = textacy.io.unzip(
-        (
-            doc._.to_terms_list(
-                ngrams=ngrams,
-                entities=entities,
-                normalize=normalize,
-                as_strings=as_strings,
-                filter_stops=filter_stops,
-                filter_nums=filter_nums,
-                include_pos=include_pos,
-                min_freq=min_freq,
-            ),
-            doc._.meta["basin"],
-            doc._.meta["year"],
-        )
-        for doc in corpus
+    """
+    Extract the terms list, basin and year of each document of a corpus.
+
+    With ``n_process > 1`` docs are serialised in batches of ``batch_size``
+    and terms are extracted by a pool of worker processes, which rebuild the
+    docs on a blank vocabulary of the corpus' language. Results keep the
+    order of the corpus and are returned as lists rather than lazily. An
+    empty corpus gives empty lists.
+
+    Returns
+    -------
+    tokenized_docs, basin_group, year_group : tuple
+        iterables over the docs
+    """
+    kwargs = dict(
+        ngrams=ngrams,
+        entities=entities,
+        normalize=normalize,
+        as_strings=as_strings,
+        filter_stops=filter_stops,
+        filter_nums=filter_nums,
+        include_pos=include_pos,
+        min_freq=min_freq,
     )
 
+    if n_process > 1:
+        docs = iter(corpus)
+        first = next(docs, None)
+        if first is None:
+            return [], [], []
+        docs = itertools.chain([first], docs)
+
+        with multiprocessing.Pool(
+            processes=n_process,
+            initializer=_init_worker,
+            initargs=(first.lang_,),
+        ) as pool:
+            records = list(
+                itertools.chain.from_iterable(
+                    pool.imap(
+                        functools.partial(_extract_batch, **kwargs),
+                        _iter_doc_batches(docs, batch_size=batch_size),
+                    )
+                )
+            )
+    else:
+        records = (
+            (terms, meta["basin"], meta["year"])
+            for terms, meta in iter_doc_terms(corpus, **kwargs)
+        )
+
+    # unzip yields no streams at all for an empty corpus
+    streams = textacy.io.unzip(records)
+    if not streams:
+        return [], [], []
+    tokenized_docs, basin_group, year_group = streams
+
     return tokenized_docs, basin_group, year_group
+
+
+def write_term_streams(tokenized_docs, basin_group, year_group, dirpath):
+    """
+    Persist the output of ``tokenize_corpus`` in a compact integer format,
+    so that the vectorizer can be re-fitted without deserialising the
+    corpus and re-extracting terms (see ``io.read_term_streams``).
+
+    Layout of ``dirpath``:
+
+    - ``vocabulary.json``: list of terms, the position is the term id
+    - ``term_ids.npy``: uint32 term ids of all docs, concatenated
+    - ``doc_offsets.npy``: int64, the terms of doc ``i`` are
+      ``term_ids[doc_offsets[i]:doc_offsets[i + 1]]``
+    - ``groups.json``: basin and year label of each doc
+
+    Parameters
+    ----------
+    tokenized_docs : iterable
+        terms list per doc
+    basin_group : iterable
+    year_group : iterable
+    dirpath : str
+        output directory, written atomically
+    """
+    # ids in order of first occurrence
+    vocabulary = collections.defaultdict()
+    vocabulary.default_factory = vocabulary.__len__
+
+    term_ids = array("I")
+    doc_offsets = array("q", [0])
+    groups = {"basin": [], "year": []}
+
+    for terms, basin, year in zip(tokenized_docs, basin_group, year_group):
+        term_ids.extend(vocabulary[term] for term in terms)
+        doc_offsets.append(len(term_ids))
+        groups["basin"].append(basin)
+        groups["year"].append(year)
+
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    with open(os.path.join(tmp_dirpath, "vocabulary.json"), "w") as f:
+        json.dump(sorted(vocabulary, key=vocabulary.__getitem__), f)
+    np.save(
+        os.path.join(tmp_dirpath, "term_ids.npy"),
+        np.frombuffer(term_ids, dtype=np.uint32),
+    )
+    np.save(
+        os.path.join(tmp_dirpath, "doc_offsets.npy"),
+        np.frombuffer(doc_offsets, dtype=np.int64),
+    )
+    with open(os.path.join(tmp_dirpath, "groups.json"), "w") as f:
+        json.dump(groups, f)
+
+    shutil.rmtree(dirpath, ignore_errors=True)
+    os.replace(tmp_dirpath, dirpath)
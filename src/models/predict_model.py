@@ -1,20 +1,537 @@
 # -*- coding: utf-8 -*-
 import os
+import json
+import time
+import shutil
 import logging
+import tracemalloc
+import concurrent.futures
+import numpy as np
+import scipy.sparse as sp
+import pandas as pd
+import sklearn.base
 import textacy
 import textacy.tm
 from tqdm import tqdm
+from sklearn.decomposition import (
+    NMF,
+    LatentDirichletAllocation,
+    non_negative_factorization,
+)
+from sklearn.utils.extmath import randomized_svd
+from references import nlp_dicts
+from src.data import io
+
+# data shared by all fits of a worker process, see _init_worker
+_WORKER_DATA = {}
+
+# model types of TopicModelPermutation: textacy.tm.TopicModel model name and
+# parameters, the remaining parameters are textacy's defaults
+MODEL_TYPES = {
+    "nmf": {"model": "nmf"},
+    "lsa": {"model": "lsa"},
+    "lda": {"model": "lda", "learning_method": "batch"},
+    "lda_online": {"model": "lda", "learning_method": "online"},
+}
+
+
+def _init_worker(grp_term_matrix, id_to_term):
+    _WORKER_DATA["grp_term_matrix"] = grp_term_matrix
+    _WORKER_DATA["id_to_term"] = id_to_term
+
+
+def _init_pool_worker(grp_term_matrix, id_to_term):
+    import matplotlib
+
+    # plots are only written to disk
+    matplotlib.use("Agg")
+    _init_worker(grp_term_matrix, id_to_term)
+
+
+def _fit_configuration(model_type, n_topics, model_fpath, trace_memory=False):
+    """
+    Fit one topic model.
+
+    Parameters
+    ----------
+    model_type : str
+        key of ``MODEL_TYPES``
+    n_topics : int
+    model_fpath : str, None
+        where to save the model, not saved if None
+    trace_memory : bool
+        record the peak of memory allocated during a second fit with
+        tracemalloc. Tracing slows allocations down unevenly, hence the
+        timed fit is never traced.
+
+    Returns
+    -------
+    record : dict, None
+        model type, number of topics, wall time, peak memory (NaN unless
+        ``trace_memory``) and number of iterations of the fit
+    """
+    # init model, nested parallelism is left to the process pool
+    params = dict(MODEL_TYPES[model_type])
+    model = textacy.tm.TopicModel(
+        model=params.pop("model"), n_topics=n_topics, n_jobs=1, **params
+    )
+
+    # fit model
+    start = time.perf_counter()
+    model.fit(_WORKER_DATA["grp_term_matrix"])
+    record = {
+        "model_type": model_type,
+        "n_topics": n_topics,
+        "time_s": time.perf_counter() - start,
+        "peak_memory_mb": np.nan,
+        "n_iter": getattr(model.model, "n_iter_", np.nan),
+    }
+
+    # separate, traced fit of an unfitted copy
+    if trace_memory:
+        tracemalloc.start()
+        sklearn.base.clone(model.model).fit(_WORKER_DATA["grp_term_matrix"])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record["peak_memory_mb"] = peak / 2 ** 20
+
+    # save model to disk, atomically so that a crash never leaves a
+    # truncated model behind
+    if model_fpath is not None:
+        write_topic_model(model, model_fpath)
+
+    return record
+
+
+def _render_termite_plots(model_fpath, figure_fpaths, dpi=300):
+    """
+    Render the termite plots of a saved topic model.
+
+    Parameters
+    ----------
+    model_fpath : str
+    figure_fpaths : dict
+        figure path per number of terms
+    dpi : int
+
+    Returns
+    -------
+    model_fpath : str
+    """
+    import matplotlib.pyplot as plt
+
+    model = io.read_topic_model(model_fpath)
+
+    for n_terms, figure_fpath in figure_fpaths.items():
+        model.termite_plot(
+            doc_term_matrix=_WORKER_DATA["grp_term_matrix"],
+            id2term=_WORKER_DATA["id_to_term"],
+            topics=-1,
+            n_terms=n_terms,
+            sort_topics_by="index",
+            rank_terms_by="topic_weight",
+            sort_terms_by="seriation",
+            save=figure_fpath,
+            rc_params={"dpi": dpi},
+        )
+        plt.close("all")
+
+    return model_fpath
+
+
+# fitted attributes of sklearn estimators kept by write_topic_model, besides
+# the components and what read_topic_model derives from them
+TOPIC_MODEL_ATTRIBUTES = (
+    "n_iter_",
+    "reconstruction_err_",
+    "n_batch_iter_",
+    "bound_",
+)
+
+
+def write_topic_model(model, dirpath):
+    """
+    Persist a fitted topic model as its components plus the estimator's
+    parameters instead of a pickle, to be read back (memory-mapped) with
+    ``io.read_topic_model``. Terms are not repeated, the column index of the
+    components is the vectorizer's term id.
+
+    Layout of ``dirpath``:
+
+    - ``components.npy``: float64, (n_topics, n_terms)
+    - ``meta.json``: estimator class name, parameters and scalar attributes
+
+    Parameters
+    ----------
+    model : textacy.tm.TopicModel
+    dirpath : str
+        output directory, written atomically
+    """
+    estimator = model.model
+
+    attributes = {}
+    for name in TOPIC_MODEL_ATTRIBUTES:
+        if hasattr(estimator, name):
+            # numpy scalars to python numbers
+            attributes[name] = np.asarray(getattr(estimator, name)).item()
+
+    meta = {
+        "estimator": type(estimator).__name__,
+        "params": estimator.get_params(),
+        "attributes": attributes,
+    }
+
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    np.save(
+        os.path.join(tmp_dirpath, "components.npy"),
+        np.asarray(estimator.components_, dtype=np.float64),
+    )
+    with open(os.path.join(tmp_dirpath, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(dirpath, ignore_errors=True)
+    os.replace(tmp_dirpath, dirpath)
+
+
+def _residual_components(
+    grp_term_matrix, W, H, n_components, block_size=2 ** 16
+):
+    # NNDSVD-style seed for new components: leading singular vectors of the
+    # positive part of the residual X - WH. As W and H are non-negative it
+    # is zero wherever X is, so it is only evaluated on the nonzeros of X,
+    # ``block_size`` of them at a time, and kept sparse
+    X = grp_term_matrix.tocoo()
+    data = X.data.astype(np.float64)
+    for start in range(0, X.nnz, block_size):
+        rows = X.row[start : start + block_size]
+        cols = X.col[start : start + block_size]
+        data[start : start + block_size] -= np.einsum(
+            "ij,ji->i", W[rows], H[:, cols]
+        )
+
+    residual = sp.csr_matrix(
+        (np.maximum(data, 0), (X.row, X.col)), shape=X.shape
+    )
+    residual.eliminate_zeros()
+    U, S, VT = randomized_svd(residual, n_components, random_state=1)
+    W_new = np.sqrt(S) * np.abs(U)
+    H_new = np.sqrt(S)[:, None] * np.abs(VT)
+    return W_new, H_new
+
+
+def nmf_warm_start_sweep(grp_term_matrix, n_topics_list, cold_baseline=True):
+    """
+    Fit NMF topic models for increasing numbers of topics, initialising the
+    fit for k topics from the solution for the previous k plus the missing
+    components, seeded from the residual (see ``_residual_components``).
+    The smallest k is fitted from scratch. Model parameters are textacy's
+    defaults for "nmf".
+
+    Parameters
+    ----------
+    grp_term_matrix : scipy.sparse.csr_matrix
+    n_topics_list : list
+    cold_baseline : bool
+        also fit every k from scratch and report it next to the warm start
+
+    Returns
+    -------
+    models : dict
+        warm-started textacy.tm.TopicModel per number of topics
+    report : pd.DataFrame
+        iterations, wall time and reconstruction error per k and init
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Warm-started NMF sweep.")
+
+    models, rows = {}, []
+    W, H = None, None
+
+    for n_topics in tqdm(sorted(set(n_topics_list))):
+        model = textacy.tm.TopicModel(model="nmf", n_topics=n_topics)
+
+        if cold_baseline or W is None:
+            start = time.perf_counter()
+            W_cold = model.model.fit_transform(grp_term_matrix)
+            rows.append(
+                {
+                    "n_topics": n_topics,
+                    "init": "cold",
+                    "n_iter": model.model.n_iter_,
+                    "time_s": time.perf_counter() - start,
+                    "reconstruction_err": model.model.reconstruction_err_,
+                }
+            )
+
+        if W is None:
+            # first k is the warm chain's starting point
+            W, H = W_cold, model.model.components_
+            models[n_topics] = model
+            continue
+
+        start = time.perf_counter()
+        W_new, H_new = _residual_components(
+            grp_term_matrix, W, H, n_topics - H.shape[0]
+        )
+        nmf = sklearn.base.clone(model.model).set_params(init="custom")
+        W = nmf.fit_transform(
+            grp_term_matrix, W=np.hstack([W, W_new]), H=np.vstack([H, H_new])
+        )
+        H = nmf.components_
+        rows.append(
+            {
+                "n_topics": n_topics,
+                "init": "warm",
+                "n_iter": nmf.n_iter_,
+                "time_s": time.perf_counter() - start,
+                "reconstruction_err": nmf.reconstruction_err_,
+            }
+        )
+        models[n_topics] = textacy.tm.TopicModel(model=nmf)
+
+    return models, pd.DataFrame(rows)
+
+
+def reconstruction_error(doc_term_matrix, W, H):
+    """
+    Frobenius norm of ``X - WH`` for a sparse X without densifying it,
+    via ``||X||^2 - 2 <X, WH> + ||WH||^2``.
+
+    Parameters
+    ----------
+    doc_term_matrix : scipy.sparse.csr_matrix
+        X, (n_docs, n_terms)
+    W : np.ndarray
+        (n_docs, n_topics)
+    H : np.ndarray
+        (n_topics, n_terms)
+
+    Returns
+    -------
+    float
+    """
+    x_sq = doc_term_matrix.multiply(doc_term_matrix).sum()
+    cross = np.sum(W * (doc_term_matrix @ H.T))
+    wh_sq = np.sum((W.T @ W) * (H @ H.T))
+    return float(np.sqrt(max(x_sq - 2 * cross + wh_sq, 0.0)))
+
+
+def top_term_ids(H, n_terms=10):
+    """
+    Ids of the ``n_terms`` highest-weighted terms per topic, by weight.
+    """
+    n_terms = min(n_terms, H.shape[1])
+    top = np.argpartition(-H, n_terms - 1, axis=1)[:, :n_terms]
+    order = np.argsort(-np.take_along_axis(H, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def umass_coherence(doc_term_matrix, top_terms):
+    """
+    UMass coherence per topic, averaged over the pairs of its top terms:
+    ``log((D(w_m, w_l) + 1) / D(w_l))`` for l < m in rank order, where D
+    counts the docs (rows) containing the terms.
+
+    Parameters
+    ----------
+    doc_term_matrix : scipy.sparse.csr_matrix
+    top_terms : np.ndarray
+        (n_topics, n_terms) term ids in rank order, see ``top_term_ids``
+
+    Returns
+    -------
+    np.ndarray
+        (n_topics,)
+    """
+    # co-document counts of all top terms at once
+    unique_terms, index = np.unique(top_terms, return_inverse=True)
+    index = index.reshape(top_terms.shape)
+    occurrence = (doc_term_matrix[:, unique_terms] != 0).astype(np.float64)
+    co_counts = (occurrence.T @ occurrence).toarray()
+
+    n_terms = top_terms.shape[1]
+    later, earlier = np.tril_indices(n_terms, k=-1)
+    joint = co_counts[index[:, later], index[:, earlier]]
+    single = np.maximum(co_counts[index[:, earlier], index[:, earlier]], 1.0)
+    return np.log((joint + 1.0) / single).mean(axis=1)
+
+
+def topic_diversity(top_terms):
+    """
+    Share of unique terms among the top terms of all topics.
+    """
+    return np.unique(top_terms).size / top_terms.size
+
+
+def score_topic_model(model, doc_term_matrix, n_terms=10):
+    """
+    Reconstruction error, topic coherence and topic diversity of a fitted
+    textacy.tm.TopicModel.
+
+    Returns
+    -------
+    scores : dict
+    """
+    W = model.transform(doc_term_matrix)
+    H = model.model.components_
+    top_terms = top_term_ids(H, n_terms=n_terms)
+    coherence = umass_coherence(doc_term_matrix, top_terms)
+
+    return {
+        "reconstruction_err": reconstruction_error(doc_term_matrix, W, H),
+        "coherence_umass": coherence.mean(),
+        "coherence_umass_min": coherence.min(),
+        "diversity": topic_diversity(top_terms),
+    }
+
+
+def _nmf_from_components(components, **params):
+    # sklearn NMF in fitted state, usable for transform and textacy.tm
+    n_components, n_features = components.shape
+    nmf = NMF(n_components=n_components, init="custom", **params)
+    nmf.components_ = components
+    nmf.n_components_ = n_components
+    nmf.n_features_in_ = n_features
+    return nmf
+
+
+def _update_components(H, A, B, n_sweeps=5):
+    # projected block coordinate descent on H given the sufficient
+    # statistics A = sum(W'W) and B = sum(W'X)
+    for _ in range(n_sweeps):
+        for j in range(H.shape[0]):
+            if A[j, j] > 0:
+                H[j] = np.maximum(H[j] + (B[j] - A[j] @ H) / A[j, j], 0.0)
+    return H
+
+
+def fit_topic_model_minibatch(
+    dirpath,
+    model_type="nmf",
+    n_topics=10,
+    n_epochs=5,
+    forget_factor=0.7,
+    random_state=1,
+    **kwargs
+):
+    """
+    Train a topic model by streaming row blocks of a group- or document-term
+    matrix from disk (see ``train_model.write_sparse_row_blocks``). Memory
+    is bounded by one block plus the model, independent of the number of
+    rows.
+
+    - "lda": sklearn's online variational Bayes, ``partial_fit`` per block,
+      with ``total_samples`` set to the number of rows of all blocks.
+    - "nmf": online NMF (Mairal et al., 2010). For each block, W is solved
+      with H fixed, the sufficient statistics ``A = W'W`` and ``B = W'X``
+      are accumulated with decay ``forget_factor`` and H is updated by
+      projected coordinate descent. Unregularised, unlike textacy's default.
+      Blocks without non-zero entries carry no information on H and are
+      skipped.
+
+    Parameters
+    ----------
+    dirpath : str
+        directory of row blocks
+    model_type : str
+        {"nmf", "lda"}
+    n_topics : int
+    n_epochs : int
+        passes over all blocks
+    forget_factor : float
+        weight of past statistics per block ("nmf" only)
+    random_state : int
+    kwargs
+        passed on to ``LatentDirichletAllocation`` ("lda") or
+        ``non_negative_factorization`` ("nmf")
+
+    Returns
+    -------
+    textacy.tm.TopicModel
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(
+        "Mini-batch {} with {} topics from {}.".format(
+            model_type, n_topics, dirpath
+        )
+    )
+
+    if model_type == "lda":
+        # the number of rows scales each block's update to the full matrix
+        kwargs.setdefault(
+            "total_samples", io.read_sparse_row_blocks_meta(dirpath)["n_rows"]
+        )
+        lda = LatentDirichletAllocation(
+            n_components=n_topics,
+            learning_method="online",
+            random_state=random_state,
+            **kwargs
+        )
+        for _ in tqdm(range(n_epochs)):
+            for block in io.iter_sparse_row_blocks(dirpath):
+                lda.partial_fit(block)
+        return textacy.tm.TopicModel(model=lda)
+
+    if model_type != "nmf":
+        raise NotImplementedError(
+            "Mini-batch training not implemented for {}.".format(model_type)
+        )
+
+    rng = np.random.RandomState(random_state)
+    H = A = B = None
+
+    for _ in tqdm(range(n_epochs)):
+        for block in io.iter_sparse_row_blocks(dirpath):
+            if block.count_nonzero() == 0:
+                # W = 0, no information on H; an all-zero block must not
+                # seed H with zeros either
+                continue
+
+            if H is None:
+                # random init scaled to the data, as sklearn's "random",
+                # from the first non-empty block
+                scale = np.sqrt(block.mean() / n_topics)
+                H = scale * rng.rand(n_topics, block.shape[1])
+                A = np.zeros((n_topics, n_topics))
+                B = np.zeros((n_topics, block.shape[1]))
+
+            W, _, _ = non_negative_factorization(
+                block,
+                H=H,
+                n_components=n_topics,
+                init="custom",
+                update_H=False,
+                **kwargs
+            )
+            A = forget_factor * A + W.T @ W
+            B = forget_factor * B + (block.T @ W).T
+            H = _update_components(H, A, B)
+
+    if H is None:
+        raise ValueError("All row blocks in {} are empty.".format(dirpath))
+
+    nmf = _nmf_from_components(H)
+    nmf.n_iter_ = n_epochs
+    return textacy.tm.TopicModel(model=nmf)
 
 
 class TopicModelPermutation:
-    def __init__(self, grp_term_matrix, vectorizer, version=None):
+    def __init__(
+        self, grp_term_matrix, vectorizer, version=None, model_types=None
+    ):
         # matrix & model
         self.grp_term_matrix = grp_term_matrix
         self.vectorizer = vectorizer
         self.version = version
 
-        # sklearn.decomposition.<model>
-        self.model_types = ["nmf", "lsa"]
+        # keys of MODEL_TYPES, LDA ("lda", "lda_online") is opt-in as its
+        # fits take much longer
+        if model_types is None:
+            model_types = ["nmf", "lsa"]
+        self.model_types = list(model_types)
 
         # cols = number of topics in the model to be initialized
         self.n_topics_list = [2, 3, 4, 5, 6, 7, 8, 9]
@@ -22,59 +539,456 @@ class TopicModelPermutation:
         # rows = number of terms
         self.n_terms_list = [10, 30, 50]
 
-    def calc(self, model_dir=None, figure_dir=None, save=True, plot=True):
+    def model_fpath(self, model_dir, model_type, n_topics):
+        return os.path.join(
+            model_dir,
+            "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_{}_{}".format(
+                self.version, model_type.upper(), n_topics
+            ),
+        )
+
+    def figure_fpath(self, figure_dir, model_type, n_topics, n_terms):
+        return os.path.join(
+            figure_dir,
+            "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_{}_{}x{}.{}".format(
+                self.version, model_type.upper(), n_topics, n_terms, "png"
+            ),
+        )
+
+    def calc(
+        self,
+        model_dir=None,
+        save=True,
+        n_jobs=1,
+        warm_start=False,
+        trace_memory=False,
+    ):
+        """
+        Fit one model per ``(model_type, n_topics)``, fanned out over a pool
+        of ``n_jobs`` processes. Configurations whose model already exists
+        are skipped, hence an interrupted run resumes where it stopped.
+        Termite plots are rendered from the saved models by ``plot``.
+
+        Wall time, iterations and, with ``trace_memory``, peak memory of
+        each fit are recorded (see ``_fit_configuration``) and, with
+        ``save``, merged into a table of all fits next to the models. Times
+        of concurrent fits compete for the CPU, use ``n_jobs=1`` for a fair
+        comparison of model types. LDA is only fitted if requested via
+        ``model_types``.
+
+        Parameters
+        ----------
+        model_dir : str, None
+        save : bool
+            save fitted models to ``model_dir``
+        n_jobs : int
+            number of worker processes
+        warm_start : bool
+            fit NMF models with ``nmf_warm_start_sweep`` before fanning out
+            the remaining configurations. The sweep is sequential and
+            requires ``save``; it is re-run as a whole if any NMF model is
+            missing. Its report is saved next to the models; see
+            ``benchmark.benchmark_nmf_warm_start`` for the comparison with
+            cold starts.
+        trace_memory : bool
+            record peak memory per fit, from an additional traced fit of
+            each configuration
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per fitted configuration of this run
+        """
         logger = logging.getLogger(__name__)
         logger.info("Topic modelling permutation.")
 
-        for model_type in tqdm(self.model_types):
+        if warm_start and "nmf" in self.model_types:
+            if not save:
+                raise ValueError("warm_start requires save=True")
+            self._warm_start_nmf(model_dir)
+
+        tasks = self._outstanding_tasks(model_dir, save)
+        logger.info(
+            "{} of {} configurations outstanding.".format(
+                len(tasks), len(self.model_types) * len(self.n_topics_list)
+            )
+        )
+
+        df_fits = pd.DataFrame(
+            self._fit_tasks(tasks, n_jobs, trace_memory),
+            columns=[
+                "model_type",
+                "n_topics",
+                "time_s",
+                "peak_memory_mb",
+                "n_iter",
+            ],
+        )
+
+        if save:
+            self._save_fits(df_fits, model_dir)
+
+        return df_fits
+
+    def _warm_start_nmf(self, model_dir):
+        # NMF models of all n_topics from one warm-started sweep, unless
+        # they all exist already
+        if all(
+            os.path.exists(self.model_fpath(model_dir, "nmf", n_topics))
+            for n_topics in self.n_topics_list
+        ):
+            return
+
+        # the cold comparison is left to the benchmarks
+        models, report = nmf_warm_start_sweep(
+            self.grp_term_matrix, self.n_topics_list, cold_baseline=False
+        )
+        for n_topics, model in models.items():
+            write_topic_model(
+                model, self.model_fpath(model_dir, "nmf", n_topics)
+            )
+
+        report.to_csv(
+            os.path.join(
+                model_dir,
+                "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_NMF_WARMSTART"
+                ".csv".format(self.version),
+            ),
+            index=False,
+        )
+
+    def _outstanding_tasks(self, model_dir, save):
+        # (model_type, n_topics, model_fpath) of the models still missing
+        tasks = []
+        for model_type in self.model_types:
+            for n_topics in self.n_topics_list:
+                model_fpath = None
+                if save:
+                    model_fpath = self.model_fpath(
+                        model_dir, model_type, n_topics
+                    )
+                    if os.path.exists(model_fpath):
+                        continue
+
+                tasks.append((model_type, n_topics, model_fpath))
+
+        return tasks
+
+    def _fit_tasks(self, tasks, n_jobs, trace_memory):
+        # records of _fit_configuration, in-process for n_jobs == 1
+        initargs = (self.grp_term_matrix, self.vectorizer.id_to_term)
+
+        if n_jobs == 1:
+            _init_worker(*initargs)
+            return [
+                _fit_configuration(*task, trace_memory) for task in tqdm(tasks)
+            ]
+
+        records = []
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=initargs,
+        ) as executor:
+            futures = [
+                executor.submit(_fit_configuration, *task, trace_memory)
+                for task in tasks
+            ]
+            for future in tqdm(
+                concurrent.futures.as_completed(futures),
+                total=len(futures),
+            ):
+                records.append(future.result())
+
+        return records
+
+    def _save_fits(self, df_fits, model_dir):
+        # merge into the table of all fits, keeping fits of earlier,
+        # interrupted runs
+        fpath = os.path.join(
+            model_dir,
+            "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_FITS.csv".format(
+                self.version
+            ),
+        )
+        df_all = df_fits
+        if os.path.exists(fpath):
+            df_all = pd.concat([pd.read_csv(fpath), df_fits])
+            df_all = df_all.drop_duplicates(
+                ["model_type", "n_topics"], keep="last"
+            )
+        df_all.sort_values(["model_type", "n_topics"]).to_csv(
+            fpath, index=False
+        )
+
+    def plot(
+        self,
+        model_dir,
+        figure_dir,
+        n_terms_list=None,
+        dpi=300,
+        n_jobs=1,
+        overwrite=False,
+    ):
+        """
+        Render the termite plots of all saved models of the permutation (no
+        refitting), one task per model fanned out over a pool of ``n_jobs``
+        processes with the non-interactive Agg backend.
+
+        Parameters
+        ----------
+        model_dir : str
+        figure_dir : str
+        n_terms_list : list, None
+            numbers of terms, defaults to ``self.n_terms_list``
+        dpi : int
+        n_jobs : int
+            number of worker processes
+        overwrite : bool
+            re-render existing figures, e.g. at a different ``dpi``
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("Rendering termite plots.")
+
+        if n_terms_list is None:
+            n_terms_list = self.n_terms_list
+
+        tasks = []
+        for model_type in self.model_types:
             for n_topics in self.n_topics_list:
-                for n_terms in self.n_terms_list:
+                model_fpath = self.model_fpath(model_dir, model_type, n_topics)
+                if not os.path.exists(model_fpath):
+                    logger.warning("Missing model {}.".format(model_fpath))
+                    continue
 
-                    # init model
-                    model = textacy.tm.TopicModel(
-                        model=model_type, n_topics=n_topics, n_jobs=-1
+                figure_fpaths = {
+                    n_terms: self.figure_fpath(
+                        figure_dir, model_type, n_topics, n_terms
                     )
+                    for n_terms in n_terms_list
+                }
+                if not overwrite:
+                    figure_fpaths = {
+                        n_terms: fpath
+                        for n_terms, fpath in figure_fpaths.items()
+                        if not os.path.exists(fpath)
+                    }
+                if figure_fpaths:
+                    tasks.append((model_fpath, figure_fpaths, dpi))
+
+        initargs = (self.grp_term_matrix, self.vectorizer.id_to_term)
+
+        if n_jobs == 1:
+            _init_worker(*initargs)
+            for task in tqdm(tasks):
+                _render_termite_plots(*task)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_pool_worker,
+                initargs=initargs,
+            ) as executor:
+                futures = [
+                    executor.submit(_render_termite_plots, *task)
+                    for task in tasks
+                ]
+                for future in tqdm(
+                    concurrent.futures.as_completed(futures),
+                    total=len(futures),
+                ):
+                    future.result()
+
+    def score(self, model_dir, n_terms=10, save=True):
+        """
+        Score all saved models of the permutation (no refitting), see
+        ``score_topic_model``, and write one summary table. LDA's components
+        are not normalised like NMF's, compare its reconstruction error only
+        among LDA models.
+
+        Parameters
+        ----------
+        model_dir : str
+        n_terms : int
+            number of top terms per topic for coherence and diversity
+        save : bool
+            save the table as CSV to ``model_dir``
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per (model_type, n_topics)
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("Scoring topic models.")
+
+        rows = []
+        for model_type in self.model_types:
+            for n_topics in self.n_topics_list:
+                fpath = self.model_fpath(model_dir, model_type, n_topics)
+                if not os.path.exists(fpath):
+                    logger.warning("Missing model {}.".format(fpath))
+                    continue
+
+                model = io.read_topic_model(fpath)
+                rows.append(
+                    {
+                        "model_type": model_type,
+                        "n_topics": n_topics,
+                        **score_topic_model(
+                            model, self.grp_term_matrix, n_terms=n_terms
+                        ),
+                    }
+                )
+
+        df_scores = pd.DataFrame(rows)
+
+        if save:
+            df_scores.to_csv(
+                os.path.join(
+                    model_dir,
+                    "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_SCORES.csv".format(
+                        self.version
+                    ),
+                ),
+                index=False,
+            )
+
+        return df_scores
+
+
+class TopicProjector:
+    """
+    Project new raw texts onto a fitted topic model, through the chain used
+    to build the training data: ``preprocess_text_fused`` as in
+    ``make_corpus.read_file``, spaCy, ``to_terms_list`` with the parameters
+    of ``extract.tokenize_corpus`` and the fitted vectorizer's vocabulary
+    and weighting. Each text is vectorised as a group of its own; terms
+    missing from the vocabulary are dropped.
+
+    Parameters
+    ----------
+    vectorizer : textacy.vsm.GroupVectorizer
+        fitted vectorizer
+    model : textacy.tm.TopicModel
+        topic model fitted on the vectorizer's group-term matrix
+    nlp : spacy.language.Language
+        pipeline the training corpus was parsed with
+    specific_stopwords : iterable, None
+        stopwords removed in pre-processing, defaults to those of the
+        training corpus, ``nlp_dicts.stopwords_bbc_monitoring``
+    terms_kwargs : dict, None
+        overrides of the ``to_terms_list`` parameters
+    """
+
+    def __init__(
+        self,
+        vectorizer,
+        model,
+        nlp,
+        specific_stopwords=None,
+        terms_kwargs=None,
+    ):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.nlp = nlp
+
+        # preprocess_text_fused requires stopwords
+        if specific_stopwords is None:
+            specific_stopwords = nlp_dicts.stopwords_bbc_monitoring
+        self.specific_stopwords = specific_stopwords
+
+        # defaults of extract.tokenize_corpus
+        self.terms_kwargs = dict(
+            ngrams=(1, 2),
+            entities=False,
+            normalize="lemma",
+            as_strings=True,
+            filter_stops=True,
+            filter_nums=True,
+            include_pos={"ADJ", "NOUN", "VERB"},
+            min_freq=2,
+        )
+        self.terms_kwargs.update(terms_kwargs or {})
+
+    @classmethod
+    def from_files(
+        cls, vectorizer_fpath, model_fpath, nlp=None, backend="full", **kwargs
+    ):
+        """
+        Projector from a saved vectorizer and topic model, see
+        ``io.read_vectorizer`` and ``io.read_topic_model``. The nlp pipeline
+        defaults to ``make_corpus.load_nlp(backend)``, pass the backend the
+        training corpus was built with (``pipeline.nlp_backend``).
+        """
+        from src.data import make_corpus
+
+        if nlp is None:
+            nlp = make_corpus.load_nlp(backend=backend)
+        return cls(
+            vectorizer=io.read_vectorizer(vectorizer_fpath),
+            model=io.read_topic_model(model_fpath),
+            nlp=nlp,
+            **kwargs
+        )
+
+    def tokenize(self, texts, batch_size=32):
+        """
+        Terms list per text.
+        """
+        from src.data import make_corpus
+
+        texts = (
+            make_corpus.preprocess_text_fused(
+                text,
+                char_count_filter=True,
+                stopwords=self.specific_stopwords,
+                min_len=3,
+                max_len=15,
+            )
+            for text in texts
+        )
+        return [
+            list(doc._.to_terms_list(**self.terms_kwargs))
+            for doc in self.nlp.pipe(texts, batch_size=batch_size)
+        ]
+
+    def vectorize(self, tokenized_docs):
+        """
+        Weighted doc-term matrix of terms lists, one row per doc.
+        """
+        vocabulary = self.vectorizer.vocabulary_terms
+        indices, indptr = [], [0]
+        for terms in tokenized_docs:
+            indices.extend(
+                vocabulary[term] for term in terms if term in vocabulary
+            )
+            indptr.append(len(indices))
+
+        doc_term_matrix = sp.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(indptr) - 1, len(vocabulary)),
+        )
+        doc_term_matrix.sum_duplicates()
+
+        return self.vectorizer._reweight_values(doc_term_matrix)
+
+    def transform(self, texts, batch_size=32):
+        """
+        Topic weights of raw texts.
+
+        Parameters
+        ----------
+        texts : iterable
+            raw texts
+        batch_size : int
+            texts per spaCy batch
 
-                    # fit model
-                    model.fit(self.grp_term_matrix)
-
-                    # transform group-term matrix to group-topic matrix
-                    model.transform(self.grp_term_matrix)
-
-                    # save model to disk
-                    if save:
-                        model.save(
-                            os.path.join(
-                                model_dir,
-                                "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_{}_{}x{}.{}".format(
-                                    self.version,
-                                    model_type.upper(),
-                                    n_topics,
-                                    n_terms,
-                                    "pkl",
-                                ),
-                            )
-                        )
-
-                    # termite plot
-                    if plot:
-                        model.termite_plot(
-                            doc_term_matrix=self.grp_term_matrix,
-                            id2term=self.vectorizer.id_to_term,
-                            topics=-1,
-                            n_terms=n_terms,
-                            sort_topics_by="index",
-                            rank_terms_by="topic_weight",
-                            sort_terms_by="seriation",
-                            save=os.path.join(
-                                figure_dir,
-                                "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_{}_{}x{}.{}".format(
-                                    self.version,
-                                    model_type.upper(),
-                                    n_topics,
-                                    n_terms,
-                                    "png",
-                                ),
-                            ),
-                            rc_params={"dpi": 300},
-                        )
+        Returns
+        -------
+        np.ndarray
+            (n_texts, n_topics)
+        """
+        doc_term_matrix = self.vectorize(
+            self.tokenize(texts, batch_size=batch_size)
+        )
+        return self.model.transform(doc_term_matrix)
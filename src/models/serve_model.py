@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+import concurrent.futures
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.models import predict_model
+
+
+class MicroBatcher:
+    """
+    Collect the texts of concurrent requests into batches, each projected by
+    one ``TopicProjector.transform`` call (a single ``nlp.pipe`` pass) in a
+    background thread. A batch is closed once it holds ``max_batch_size``
+    texts or ``max_wait_ms`` after its first request arrived. If a batch
+    fails, its requests are retried one by one, so that an error only
+    reaches the requests that cause it.
+
+    Parameters
+    ----------
+    projector : predict_model.TopicProjector
+    max_batch_size : int
+    max_wait_ms : float
+    """
+
+    def __init__(self, projector, max_batch_size=32, max_wait_ms=10):
+        self.projector = projector
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Future of the topic weights, (n_texts, n_topics), of ``texts``.
+        """
+        future = concurrent.futures.Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def _get_request(self, timeout=None):
+        # next request with texts, empty ones are answered right away
+        while True:
+            request_texts, future = self._queue.get(timeout=timeout)
+            if request_texts:
+                return request_texts, future
+            future.set_result(np.zeros((0, self.projector.model.n_topics)))
+
+    def _next_batch(self):
+        # block for the first request, then wait at most max_wait_ms
+        requests = [self._get_request()]
+        n_texts = len(requests[0][0])
+        deadline = time.perf_counter() + self.max_wait_ms / 1e3
+
+        while n_texts < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._get_request(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            n_texts += len(request[0])
+
+        return requests
+
+    def _transform(self, requests):
+        # topic weights per request, from one transform of all their texts
+        texts = [
+            text for request_texts, _ in requests for text in request_texts
+        ]
+        weights = self.projector.transform(
+            texts, batch_size=self.max_batch_size
+        )
+
+        start, results = 0, []
+        for request_texts, _ in requests:
+            results.append(weights[start : start + len(request_texts)])
+            start += len(request_texts)
+        return results
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+
+            try:
+                results = self._transform(requests)
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0][1].set_exception(e)
+                    continue
+                # retry each request on its own, so that only the failing
+                # ones fail
+                for request in requests:
+                    try:
+                        (result,) = self._transform([request])
+                    except Exception as request_error:
+                        request[1].set_exception(request_error)
+                    else:
+                        request[1].set_result(result)
+                continue
+
+            for (_, future), result in zip(requests, results):
+                future.set_result(result)
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    """
+    - ``GET /health``: ``{"status": "ok", "n_topics": int}``
+    - ``POST /topics`` with ``{"texts": [str, ...]}``, at least one text:
+      ``{"topics": [[float, ...], ...]}``, topic weights per text
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(
+            200,
+            {
+                "status": "ok",
+                "n_topics": self.server.batcher.projector.model.n_topics,
+            },
+        )
+
+    def do_POST(self):
+        if self.path != "/topics":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            if (
+                not isinstance(texts, list)
+                or not texts
+                or not all(isinstance(text, str) for text in texts)
+            ):
+                raise ValueError("texts must be a non-empty list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            weights = self.server.batcher.submit(texts).result()
+        except Exception as e:
+            logging.getLogger(__name__).exception("Scoring failed.")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self._send_json(200, {"topics": weights.tolist()})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format % args)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    # the default backlog of 5 drops connections of concurrent clients
+    request_queue_size = 128
+
+
+def make_server(
+    projector, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=10
+):
+    """
+    HTTP server scoring requests with ``projector``, see
+    ``ScoringRequestHandler``. Requests are handled in threads and share
+    batches through a ``MicroBatcher``.
+
+    Returns
+    -------
+    ScoringServer
+    """
+    server = ScoringServer((host, port), ScoringRequestHandler)
+    server.batcher = MicroBatcher(
+        projector, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+    )
+    return server
+
+
+def serve(
+    vectorizer_fpath,
+    model_fpath,
+    host="127.0.0.1",
+    port=8000,
+    max_batch_size=32,
+    max_wait_ms=10,
+    nlp=None,
+    nlp_backend="full",
+    specific_stopwords=None,
+):
+    """
+    Load the spaCy pipeline, vectorizer and topic model once and serve
+    scoring requests until interrupted.
+
+    Parameters
+    ----------
+    vectorizer_fpath : str
+    model_fpath : str
+    host : str
+    port : int
+    max_batch_size : int
+        texts per batch
+    max_wait_ms : float
+        time a request waits for others to share its batch
+    nlp : spacy.language.Language, None
+        defaults to ``make_corpus.load_nlp(nlp_backend)``
+    nlp_backend : str
+        spaCy backend the training corpus was built with
+    specific_stopwords : iterable, None
+        defaults to the stopwords of the training corpus, see
+        ``predict_model.TopicProjector``
+    """
+    logger = logging.getLogger(__name__)
+
+    start = time.perf_counter()
+    projector = predict_model.TopicProjector.from_files(
+        vectorizer_fpath,
+        model_fpath,
+        nlp=nlp,
+        backend=nlp_backend,
+        specific_stopwords=specific_stopwords,
+    )
+    # warm-up, lazily initialised pipeline components
+    projector.transform(["warm up"])
+    logger.info(
+        "Loaded models in {:.1f}s.".format(time.perf_counter() - start)
+    )
+
+    server = make_server(
+        projector,
+        host=host,
+        port=port,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+    )
+    logger.info("Serving on http://{}:{}.".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    from src import pipeline
+
+    # python -m src.models.serve_model [model_type] [n_topics]
+    model_type = sys.argv[1] if len(sys.argv) > 1 else "nmf"
+    n_topics = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    serve(
+        vectorizer_fpath=pipeline.fpath_vectorizer(),
+        model_fpath=pipeline.fpath_topic_model(model_type, n_topics),
+        nlp_backend=pipeline.nlp_backend,
+    )
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import os
-import pickle
+import json
+import shutil
 import logging
+import numpy as np
+import scipy.sparse as sp
+import pandas as pd
 import textacy
 import textacy.vsm
+from src.data import io, tables
 
 
 def group_vectorizer(
@@ -51,30 +56,341 @@ def group_vectorizer_fit_transform(
     grp_term_matrix = vectorizer.fit_transform(tokenized_docs, group_data)
 
     if save:
-        # save group-term matrix to disk as a single .npz file (numpy binary format)
-        textacy.io.matrix.write_sparse_matrix(
-            data=grp_term_matrix,
-            filepath=os.path.join(
-                data_dir,
-                "BBC_2007_07_04_CORPUS_TEXTACY_{}_GROUPTERMMATRIX_STEP1".format(
-                    version
-                ),
+        save_features(
+            grp_term_matrix, vectorizer, data_dir, model_dir, version
+        )
+
+    return grp_term_matrix
+
+
+def _count_group_terms(term_ids, doc_offsets, doc_grp_ids, shape, block_size):
+    # (group, term) counts of term streams, summed over blocks of whole docs
+    # with about block_size term occurrences each, so that the per-occurrence
+    # arrays never span more than one block
+    grp_term_matrix = sp.csr_matrix(shape, dtype=np.int32)
+
+    n_docs = len(doc_offsets) - 1
+    block_starts = np.searchsorted(
+        doc_offsets[:-1], np.arange(0, doc_offsets[-1], block_size), "right"
+    )
+    bounds = np.unique(np.concatenate([[0], block_starts - 1, [n_docs]]))
+
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        start, stop = doc_offsets[first], doc_offsets[last]
+        rows = np.repeat(
+            doc_grp_ids[first:last], np.diff(doc_offsets[first : last + 1])
+        )
+        cols = np.asarray(term_ids[start:stop], dtype=np.intc)
+        # duplicate entries are summed by the conversion
+        grp_term_matrix = grp_term_matrix + sp.csr_matrix(
+            (np.ones(len(cols), dtype=np.int32), (rows, cols)),
+            shape=shape,
+            dtype=np.int32,
+        )
+
+    return grp_term_matrix
+
+
+def group_vectorizer_fit_transform_term_ids(
+    vectorizer,
+    dirpath,
+    group="basin",
+    data_dir=None,
+    model_dir=None,
+    version=None,
+    save=True,
+    block_size=2 ** 20,
+):
+    """
+    Fit ``vectorizer`` and compute the group-term matrix directly from term
+    streams written by ``extract.write_term_streams``, without decoding
+    them to strings.
+
+    Terms are counted per group from the memory-mapped integer term ids,
+    one block of about ``block_size`` term occurrences at a time (see
+    ``_count_group_terms``); term and group ids are assigned in order of
+    first occurrence, as in ``GroupVectorizer._count_terms``. The
+    vectorizer's own term filtering, sorting and re-weighting are then
+    applied, hence the result is identical to
+    ``group_vectorizer_fit_transform`` on the decoded streams (see
+    ``tests/test_train_model.py``).
+
+    Parameters
+    ----------
+    vectorizer : textacy.vsm.GroupVectorizer
+        unfitted vectorizer without fixed vocabularies
+    dirpath : str
+        term streams directory
+    group : str
+        {"basin", "year"}
+    data_dir : str, None
+    model_dir : str, None
+    version : str, None
+    save : bool
+    block_size : int
+        term occurrences aggregated at once, bounds the memory of counting
+
+    Returns
+    -------
+    grp_term_matrix : scipy.sparse.csr_matrix
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Computing group-term matrix from term ids.")
+
+    if vectorizer._fixed_terms or vectorizer._fixed_grps:
+        raise NotImplementedError("Fixed vocabularies are not supported.")
+    if "bm25" in (vectorizer.tf_type, vectorizer.idf_type):
+        raise NotImplementedError("BM25 weighting is not supported.")
+
+    vocabulary, term_ids, doc_offsets, groups = io.read_term_ids(dirpath)
+
+    vocabulary_terms = {term: i for i, term in enumerate(vocabulary)}
+    vocabulary_grps = {}
+    doc_grp_ids = np.array(
+        [
+            vocabulary_grps.setdefault(grp, len(vocabulary_grps))
+            for grp in groups[group]
+        ],
+        dtype=np.intc,
+    )
+
+    grp_term_matrix = _count_group_terms(
+        term_ids,
+        doc_offsets,
+        doc_grp_ids,
+        shape=(len(vocabulary_grps), len(vocabulary_terms)),
+        block_size=block_size,
+    )
+
+    # as GroupVectorizer._fit
+    grp_term_matrix, vocabulary_terms = vectorizer._filter_terms(
+        grp_term_matrix, vocabulary_terms
+    )
+    grp_term_matrix = vectorizer._sort_vocab_and_matrix(
+        grp_term_matrix, vocabulary_terms, axis="columns"
+    )
+    vectorizer.vocabulary_terms = vocabulary_terms
+    vectorizer._fixed_terms = True
+
+    grp_term_matrix = vectorizer._sort_vocab_and_matrix(
+        grp_term_matrix, vocabulary_grps, axis="rows"
+    )
+    vectorizer.vocabulary_grps = vocabulary_grps
+    vectorizer._fixed_grps = True
+
+    if vectorizer.apply_idf:
+        n_terms = grp_term_matrix.shape[1]
+        idfs = textacy.vsm.matrix_utils.get_inverse_doc_freqs(
+            grp_term_matrix, type_=vectorizer.idf_type
+        )
+        vectorizer._idf_diag = sp.spdiags(
+            idfs, diags=0, m=n_terms, n=n_terms, format="csr"
+        )
+
+    grp_term_matrix = vectorizer._reweight_values(grp_term_matrix)
+
+    if save:
+        save_features(
+            grp_term_matrix, vectorizer, data_dir, model_dir, version
+        )
+
+    return grp_term_matrix
+
+
+def save_features(grp_term_matrix, vectorizer, data_dir, model_dir, version):
+    # save group-term matrix to disk as a single .npz file (numpy binary format)
+    textacy.io.matrix.write_sparse_matrix(
+        data=grp_term_matrix,
+        filepath=os.path.join(
+            data_dir,
+            "BBC_2007_07_04_CORPUS_TEXTACY_{}_GROUPTERMMATRIX_STEP1".format(
+                version
+            ),
+        ),
+        compressed=True,
+    )
+
+    # save fitted vectorizer
+    write_vectorizer(
+        vectorizer,
+        dirpath=os.path.join(
+            model_dir,
+            "BBC_2007_07_04_CORPUS_TEXTACY_{}_VECTORIZER".format(version),
+        ),
+    )
+
+
+# parameters of textacy.vsm.GroupVectorizer, see group_vectorizer
+VECTORIZER_PARAMS = (
+    "tf_type",
+    "apply_idf",
+    "idf_type",
+    "apply_dl",
+    "dl_type",
+    "norm",
+    "min_df",
+    "max_df",
+    "max_n_terms",
+)
+
+
+def write_vectorizer(vectorizer, dirpath):
+    """
+    Persist the state of a fitted GroupVectorizer as plain arrays instead
+    of a pickle, to be read back with ``io.read_vectorizer``.
+
+    Layout of ``dirpath``:
+
+    - ``params.json``: parameters and average doc length
+    - ``vocabulary.parquet``: term id, term and (if ``apply_idf``) idf, see
+      ``io.read_vocabulary``
+    - ``groups.json``: list of groups, the position is the group id
+    - ``idf.npy``: float64 idf per term id, only if ``apply_idf``
+
+    Parameters
+    ----------
+    vectorizer : textacy.vsm.GroupVectorizer
+        fitted vectorizer
+    dirpath : str
+        output directory, written atomically
+    """
+    params = {name: getattr(vectorizer, name) for name in VECTORIZER_PARAMS}
+    avg_doc_length = getattr(vectorizer, "_avg_doc_length", None)
+    if avg_doc_length is not None:
+        avg_doc_length = float(avg_doc_length)
+
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    terms = sorted(
+        vectorizer.vocabulary_terms, key=vectorizer.vocabulary_terms.get
+    )
+    grps = sorted(
+        vectorizer.vocabulary_grps, key=vectorizer.vocabulary_grps.get
+    )
+    df_vocabulary = pd.DataFrame(
+        {"term_id": np.arange(len(terms)), "term": terms}
+    )
+
+    with open(os.path.join(tmp_dirpath, "params.json"), "w") as f:
+        json.dump({"params": params, "avg_doc_length": avg_doc_length}, f)
+    with open(os.path.join(tmp_dirpath, "groups.json"), "w") as f:
+        json.dump(grps, f)
+    if vectorizer._idf_diag is not None:
+        idf = vectorizer._idf_diag.diagonal()
+        np.save(os.path.join(tmp_dirpath, "idf.npy"), idf)
+        df_vocabulary["idf"] = idf
+    tables.write_table(
+        df_vocabulary,
+        os.path.join(tmp_dirpath, "vocabulary.parquet"),
+        index=None,
+    )
+
+    shutil.rmtree(dirpath, ignore_errors=True)
+    os.replace(tmp_dirpath, dirpath)
+
+
+def iter_row_blocks(matrix, block_size=10000):
+    """
+    Split a sparse matrix into consecutive blocks of ``block_size`` rows.
+    """
+    matrix = matrix.tocsr()
+    for start in range(0, matrix.shape[0], block_size):
+        yield matrix[start : start + block_size]
+
+
+def iter_term_id_row_blocks(vectorizer, dirpath, block_size=10000):
+    """
+    Stream the document-term matrix of term streams written by
+    ``extract.write_term_streams`` in blocks of ``block_size`` docs. Each
+    doc is vectorised as a group of its own with a fitted ``vectorizer``:
+    terms missing from its vocabulary are dropped and values are re-weighted
+    as by the vectorizer. Term ids are memory-mapped, hence only one block
+    is held in memory, unlike with ``iter_row_blocks``.
+
+    Parameters
+    ----------
+    vectorizer : textacy.vsm.GroupVectorizer
+        fitted vectorizer
+    dirpath : str
+        term streams directory
+    block_size : int
+
+    Yields
+    ------
+    scipy.sparse.csr_matrix
+        (docs of the block, terms of the vectorizer)
+    """
+    vocabulary, term_ids, doc_offsets, _ = io.read_term_ids(dirpath)
+
+    # vectorizer column of each stream term id, -1 if not in its vocabulary
+    columns = np.array(
+        [vectorizer.vocabulary_terms.get(term, -1) for term in vocabulary],
+        dtype=np.intp,
+    )
+    n_terms = len(vectorizer.vocabulary_terms)
+
+    for start in range(0, len(doc_offsets) - 1, block_size):
+        offsets = np.asarray(doc_offsets[start : start + block_size + 1])
+        cols = columns[term_ids[offsets[0] : offsets[-1]]]
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        keep = cols >= 0
+
+        block = sp.csr_matrix(
+            (
+                np.ones(np.count_nonzero(keep), dtype=np.int32),
+                (rows[keep], cols[keep]),
             ),
+            shape=(len(offsets) - 1, n_terms),
+            dtype=np.int32,
+        )
+        block.sum_duplicates()
+        yield vectorizer._reweight_values(block)
+
+
+def write_sparse_row_blocks(row_blocks, dirpath):
+    """
+    Write row blocks of a (group- or document-) term matrix to a directory
+    of ``.npz`` files, one per block, so that topic models can be trained
+    by streaming blocks from disk (see ``io.iter_sparse_row_blocks``).
+    Blocks are written as they come, hence the full matrix never needs to
+    be held in memory. The shape of the matrix is recorded in
+    ``meta.json`` (see ``io.read_sparse_row_blocks_meta``).
+
+    Parameters
+    ----------
+    row_blocks : iterable
+        sparse matrices with the same number of columns, e.g.
+        ``iter_row_blocks(matrix)`` or ``iter_term_id_row_blocks``
+    dirpath : str
+        output directory, written atomically
+
+    Returns
+    -------
+    n_blocks : int
+    """
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+
+    n_blocks, n_rows, n_cols = 0, 0, None
+    for block in row_blocks:
+        sp.save_npz(
+            os.path.join(tmp_dirpath, "block_{:05d}.npz".format(n_blocks)),
+            sp.csr_matrix(block),
             compressed=True,
         )
+        n_blocks += 1
+        n_rows += block.shape[0]
+        n_cols = block.shape[1]
 
-        # save fitted vectorizer
-        pickle.dump(
-            vectorizer,
-            open(
-                os.path.join(
-                    model_dir,
-                    "BBC_2007_07_04_CORPUS_TEXTACY_{}_VECTORIZER.pkl".format(
-                        version
-                    ),
-                ),
-                "wb",
-            ),
+    with open(os.path.join(tmp_dirpath, "meta.json"), "w") as f:
+        json.dump(
+            {"n_blocks": n_blocks, "n_rows": n_rows, "n_cols": n_cols}, f
         )
 
-    return grp_term_matrix
+    shutil.rmtree(dirpath, ignore_errors=True)
+    os.replace(tmp_dirpath, dirpath)
+
+    return n_blocks
@@ -1,138 +1,467 @@
 # -*- coding: utf-8 -*-
 import os
+import glob
 import logging
-import en_core_web_lg
-import seaborn as sns
+import functools
+import contextlib
 from pathlib import Path
 from dotenv import find_dotenv, load_dotenv
 
-# custom module components
+# custom module components (light-weight, no heavy dependencies)
 from references import nlp_dicts
-from src.data import io, make_corpus
-from src.features import extract
-from src.models import train_model, predict_model
-from src.visualization import visualize
-
-# visualisation settings
-sns.set_context("poster")
-sns.set(rc={"figure.figsize": (16, 9.0)})
-sns.set_style("ticks")
+from src.data import cache
 
+# Heavy libraries (spaCy, textacy, gensim, matplotlib, seaborn) and the spaCy
+# model are imported and loaded lazily by the stages that actually need them,
+# so that e.g. re-plotting from cached artefacts starts up fast.
 
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
 
-# version of run
-version = "V6"
+# version of run, used as prefix of the artefact keys
+version = "V7"
+
+# number of worker processes (corpus, term extraction, topic models)
+n_process = os.cpu_count()
 
-# file names
-fname_corpus = "BBC_2007_07_04_CORPUS_TEXTACY_{}.bin.gz".format(version)
-fname_gt_matrix = (
-    "BBC_2007_07_04_CORPUS_TEXTACY_{}_GROUPTERMMATRIX_STEP1.npz".format(version)
-)
-fname_vectorizer = "BBC_2007_07_04_CORPUS_TEXTACY_{}_VECTORIZER.pkl".format(
-    version
-)
+# spaCy backend, {"full", "lean"}
+nlp_backend = "full"
 
-# load and configure spaCy nlp pipeline
-nlp = en_core_web_lg.load()
-nlp.max_length = int(30 * 1e6)
-nlp.remove_pipe("parser")
-nlp.remove_pipe("ner")
+# raw files are parsed in chunks of at most this many characters
+chunk_size = int(5 * 1e5)
+
+# corpus stored per doc with a metadata index, see io.IndexedCorpus
+indexed_corpus = True
+
+# stages; termite plots are rendered from saved models, by default only
+# along with fitting them so that re-plotting the word counts stays fast
+compute_topic_models = False
+plot_topic_models = compute_topic_models
 
 # -----------------------------------------------------------------------------
 # Initialisation
 # -----------------------------------------------------------------------------
 
-# init logger
-log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-logging.basicConfig(level=logging.INFO, format=log_fmt)
-
 # not used in this stub but often useful for finding various files
 project_dir = Path(__file__).resolve().parents[1]
 
-# find .env automagically by walking up directories until it's found, then
-# load up the .env entries as environment variables
-load_dotenv(find_dotenv())
-
 # sub-directories
+src_dir = os.path.join(project_dir, "src")
 model_dir = os.path.join(project_dir, "models")
 data_raw = os.path.join(project_dir, "data", "raw")
 data_interim = os.path.join(project_dir, "data", "interim")
 data_processed = os.path.join(project_dir, "data", "processed")
 figure_dir = os.path.join(project_dir, "reports", "figures")
 
-# file paths
-fpath_corpus = os.path.join(data_processed, fname_corpus)
-fpath_vectorizer = os.path.join(model_dir, fname_vectorizer)
-fpath_gt_matrix = os.path.join(data_processed, fname_gt_matrix)
+# raw input files
+input_filepath = os.path.join(data_raw, "BBC_2007_07_04_TXT_V2", "*.txt")
+
+# -----------------------------------------------------------------------------
+# Artefact keys
+#
+# Each artefact is keyed by a hash of its stage's parameters, the source of
+# the modules implementing the stage and the keys of its inputs. Keys are
+# part of the file names, so changing e.g. preprocess_text, the stopwords or
+# the vectorizer parameters invalidates exactly the affected downstream
+# stages. Modules are hashed as a whole, so that no helper is missed; only
+# the topic models are keyed on the code their fit actually uses.
+# -----------------------------------------------------------------------------
+
+
+def _source(*parts):
+    return os.path.join(src_dir, *parts)
+
+
+def _module_digests(*modules):
+    # source digests of whole modules, given as paths relative to src
+    return [
+        cache.source_digest(_source(*module.split("/"))) for module in modules
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def corpus_key():
+    # the corpus is updated in place when raw files change (see data_key)
+    return cache.artefact_key(
+        params={
+            "nlp_backend": nlp_backend,
+            "chunk_size": chunk_size,
+            "indexed_corpus": indexed_corpus,
+            "stopwords": sorted(nlp_dicts.stopwords_bbc_monitoring),
+            "packages": cache.package_versions(
+                ["spacy", "textacy", "en_core_web_lg", "en_core_web_sm"]
+            ),
+        },
+        code=_module_digests(
+            "data/make_corpus.py", "data/cache.py", "data/io.py"
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def data_key():
+    # name, size and modification time of the raw input files; stat only,
+    # content hashes are left to make_corpus.update_corpus
+    return cache.artefact_key(
+        params=[
+            (os.path.basename(fp),) + cache.file_signature(fp)
+            for fp in sorted(glob.glob(input_filepath))
+        ]
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def tokens_key():
+    return cache.artefact_key(
+        code=_module_digests(
+            "features/extract.py", "features/corpus_stats.py", "data/io.py"
+        ),
+        upstream=[corpus_key(), data_key()],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def features_key():
+    return cache.artefact_key(
+        params=cache.package_versions(["textacy", "scikit-learn"]),
+        code=_module_digests(
+            "models/train_model.py", "data/io.py", "data/tables.py"
+        ),
+        upstream=[tokens_key()],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def topic_models_key():
+    # the fit path only, plotting and scoring read the models
+    fpath = _source("models", "predict_model.py")
+    names = cache.source_names(
+        fpath,
+        roots=["TopicModelPermutation.__init__", "TopicModelPermutation.calc"],
+    )
+    return cache.artefact_key(
+        params=cache.package_versions(["textacy", "scikit-learn"]),
+        code=[cache.source_digest(fpath, names=names)],
+        upstream=[features_key()],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def word_counts_key():
+    return cache.artefact_key(
+        code=_module_digests(
+            "features/corpus_stats.py",
+            "visualization/visualize.py",
+            "data/tables.py",
+        ),
+        upstream=[corpus_key(), data_key()],
+    )
+
+
+def versioned(key_func):
+    # version label of an artefact as used in file names
+    return "{}-{}".format(version, key_func())
+
+
+def fpath_corpus():
+    # directory of the indexed corpus, else a single file
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}{}".format(
+            versioned(corpus_key), "" if indexed_corpus else ".bin.gz"
+        ),
+    )
+
+
+def fpath_terms():
+    return os.path.join(
+        data_interim,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_TERMS".format(versioned(tokens_key)),
+    )
+
+
+def fpath_gt_matrix():
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_GROUPTERMMATRIX_STEP1.npz".format(
+            versioned(features_key)
+        ),
+    )
+
+
+def fpath_vectorizer():
+    return os.path.join(
+        model_dir,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_VECTORIZER".format(
+            versioned(features_key)
+        ),
+    )
+
+
+def fpath_topic_model(model_type, n_topics):
+    return os.path.join(
+        model_dir,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_TM_{}_{}".format(
+            versioned(topic_models_key), model_type.upper(), n_topics
+        ),
+    )
+
+
+def fpath_grouped_stats():
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_TERMSTATS_GROUPED".format(
+            versioned(word_counts_key)
+        ),
+    )
+
+
+def fpath_term_stats():
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_TERMSTATS.parquet".format(
+            versioned(word_counts_key)
+        ),
+    )
+
+
+def fpath_word_counts():
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDCOUNT.parquet".format(
+            versioned(word_counts_key)
+        ),
+    )
+
+
+def fpath_word_doc_counts():
+    return os.path.join(
+        data_processed,
+        "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDDOCCOUNT.parquet".format(
+            versioned(word_counts_key)
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_nlp():
+    # load and configure spaCy nlp pipeline
+    from src.data import make_corpus
+
+    # whole raw files are parsed as single docs without chunking
+    return make_corpus.load_nlp(
+        backend=nlp_backend, max_length=None if chunk_size else int(30 * 1e6)
+    )
+
 
 # -----------------------------------------------------------------------------
 # 1) IO/Corpus
 # -----------------------------------------------------------------------------
-if not os.path.exists(fpath_corpus):
-    corpus = make_corpus.create_corpus(
-        input_filepath=os.path.join(data_raw, "BBC_2007_07_04_TXT_V2", "*.txt"),
-        output_filepath=os.path.join(data_processed, fname_corpus),
-        nlp=nlp,
+@functools.lru_cache(maxsize=None)
+def load_corpus():
+    from src.data import make_corpus
+
+    # incremental: only new or changed raw files are (re-)processed
+    return make_corpus.update_corpus(
+        input_filepath=input_filepath,
+        output_filepath=fpath_corpus(),
+        nlp=get_nlp(),
         specific_stopwords=nlp_dicts.stopwords_bbc_monitoring,
         return_data=True,
+        n_process=n_process,
+        chunk_size=chunk_size,
+        indexed=indexed_corpus,
     )
-else:
-    corpus = io.read_corpus(
-        fpath=fpath_corpus, language_model=nlp, store_user_data=True
-    )
+
+
+@contextlib.contextmanager
+def get_corpus():
+    # the indexed corpus is unmapped after each stage and mapped again when
+    # a later stage reads the cached corpus
+    corpus = load_corpus()
+    if not indexed_corpus:
+        yield corpus
+        return
+
+    with corpus:
+        yield corpus
+
 
 # -----------------------------------------------------------------------------
 # 2) Feature Extraction
 # -----------------------------------------------------------------------------
-if not os.path.exists(fpath_gt_matrix):
-    vectorizer = train_model.group_vectorizer()
+@functools.lru_cache(maxsize=None)
+def get_features():
+    from src.data import io
+    from src.features import extract
+    from src.models import train_model
 
-    tokenized_docs, basin_group, year_group = extract.tokenize_corpus(
-        corpus=corpus
-    )
+    if not os.path.exists(fpath_gt_matrix()):
+        vectorizer = train_model.group_vectorizer()
+
+        # persisted term streams spare re-fits spaCy and term extraction
+        if not os.path.exists(fpath_terms()):
+            with get_corpus() as corpus:
+                streams = extract.tokenize_corpus(
+                    corpus=corpus, n_process=n_process
+                )
+                # the streams are lazy without worker processes
+                extract.write_term_streams(*streams, dirpath=fpath_terms())
+
+        # counted from the integer term ids, no strings are decoded
+        grp_term_matrix = train_model.group_vectorizer_fit_transform_term_ids(
+            vectorizer=vectorizer,
+            dirpath=fpath_terms(),
+            group="basin",
+            data_dir=data_processed,
+            model_dir=model_dir,
+            version=versioned(features_key),
+            save=True,
+        )
+    else:
+        vectorizer = io.read_vectorizer(fpath=fpath_vectorizer())
+        grp_term_matrix = io.read_group_term_matrix(fpath=fpath_gt_matrix())
+
+    return vectorizer, grp_term_matrix
 
-    grp_term_matrix = train_model.group_vectorizer_fit_transform(
-        vectorizer=vectorizer,
-        tokenized_docs=tokenized_docs,
-        group_data=basin_group,
-        data_dir=data_processed,
-        model_dir=model_dir,
-        version=version,
-        save=True,
-    )
-else:
-    vectorizer = io.read_vectorizer(fpath=fpath_vectorizer)
-    grp_term_matrix = io.read_group_term_matrix(fpath=fpath_gt_matrix)
 
 # -----------------------------------------------------------------------------
 # 3) Topic Modelling
 # -----------------------------------------------------------------------------
-compute_topic_models = False
+@functools.lru_cache(maxsize=None)
+def get_topic_model_permutation():
+    from src.models import predict_model
+
+    vectorizer, grp_term_matrix = get_features()
 
-if compute_topic_models:
-    tm_permutation = predict_model.TopicModelPermutation(
-        grp_term_matrix=grp_term_matrix, vectorizer=vectorizer, version=version
+    return predict_model.TopicModelPermutation(
+        grp_term_matrix=grp_term_matrix,
+        vectorizer=vectorizer,
+        version=versioned(topic_models_key),
     )
 
-    tm_permutation.calc(
-        model_dir=model_dir, figure_dir=figure_dir, save=True, plot=True
+
+def topic_modelling():
+    tm_permutation = get_topic_model_permutation()
+    tm_permutation.calc(model_dir=model_dir, save=True, n_jobs=n_process)
+    tm_permutation.score(model_dir=model_dir)
+
+
+def topic_model_plots():
+    # rendered from the saved models, cheap to re-run without refitting;
+    # figures that exist already are kept
+    model_fpaths = glob.glob(fpath_topic_model("*", "*"))
+    if not any(os.path.isdir(fpath) for fpath in model_fpaths):
+        # checked before predict_model and the features are loaded
+        logging.getLogger(__name__).warning("No topic models to plot.")
+        return
+
+    get_topic_model_permutation().plot(
+        model_dir=model_dir, figure_dir=figure_dir, n_jobs=n_process
     )
 
+
 # -----------------------------------------------------------------------------
-# 4) Visualise
+# 4) Statistics & Visualise
 # -----------------------------------------------------------------------------
-visualize.word_counts(
-    corpus=corpus,
-    data_dir=data_processed,
-    figure_dir=figure_dir,
-    version=version,
-)
-visualize.word_document_counts(
-    corpus=corpus,
-    data_dir=data_processed,
-    figure_dir=figure_dir,
-    version=version,
-)
+@functools.lru_cache(maxsize=None)
+def get_grouped_stats():
+    from src.features import corpus_stats
+
+    # term statistics per (basin, year, month), one pass over the corpus
+    if os.path.exists(fpath_grouped_stats()):
+        return corpus_stats.read_grouped_statistics(fpath_grouped_stats())
+
+    with get_corpus() as corpus:
+        stats = corpus_stats.grouped_corpus_statistics(corpus)
+    corpus_stats.write_grouped_statistics(stats, fpath_grouped_stats())
+    return stats
+
+
+def visualise():
+    import seaborn as sns
+    from src.data import tables
+    from src.visualization import visualize
+
+    # visualisation settings
+    sns.set_context("poster")
+    sns.set(rc={"figure.figsize": (16, 9.0)})
+    sns.set_style("ticks")
+
+    # re-plot from cached tables, the corpus is only loaded if missing
+    @functools.lru_cache(maxsize=None)
+    def get_term_stats():
+        # both tables from the grouped statistics
+        if os.path.exists(fpath_term_stats()):
+            return tables.read_table(fpath_term_stats())
+        df_stats = get_grouped_stats().aggregate().table()
+        tables.write_table(df_stats, fpath_term_stats())
+        return df_stats
+
+    if os.path.exists(fpath_word_counts()):
+        visualize.plot_word_counts(
+            tables.read_word_counts(fpath_word_counts(), n=30),
+            figure_dir=figure_dir,
+            version=versioned(word_counts_key),
+        )
+    else:
+        visualize.word_counts(
+            corpus=None,
+            data_dir=data_processed,
+            figure_dir=figure_dir,
+            version=versioned(word_counts_key),
+            df_stats=get_term_stats(),
+        )
+
+    if os.path.exists(fpath_word_doc_counts()):
+        visualize.plot_word_document_counts(
+            tables.read_word_document_counts(fpath_word_doc_counts(), n=30),
+            figure_dir=figure_dir,
+            version=versioned(word_counts_key),
+        )
+    else:
+        visualize.word_document_counts(
+            corpus=None,
+            data_dir=data_processed,
+            figure_dir=figure_dir,
+            version=versioned(word_counts_key),
+            df_stats=get_term_stats(),
+        )
+
+
+def main():
+    # init logger
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    # find .env automagically by walking up directories until it's found,
+    # then load up the .env entries as environment variables
+    load_dotenv(find_dotenv())
+
+    logger = logging.getLogger(__name__)
+    logger.info(
+        "Artefact keys: corpus {}, data {}, features {}, counts {}.".format(
+            corpus_key(), data_key(), features_key(), word_counts_key()
+        )
+    )
+
+    # feature extraction only runs here if its artefacts are missing,
+    # cached ones are loaded on demand by the topic modelling stage
+    if not os.path.exists(fpath_gt_matrix()):
+        get_features()
+
+    if compute_topic_models:
+        topic_modelling()
+
+    if plot_topic_models:
+        topic_model_plots()
+
+    visualise()
+
+    # grouped statistics for per-basin and per-year analyses
+    get_grouped_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import time
+import logging
+import collections
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from references import nlp_dicts
+from src.data import make_corpus
+
+
+def _best_of(func, repeat, *args, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_preprocess(file_list, stopwords=None, repeat=3):
+    """
+    Micro-benchmark of ``preprocess_text`` vs. ``preprocess_text_fused`` on
+    raw input files (best of ``repeat`` runs per file).
+
+    Parameters
+    ----------
+    file_list : list
+        raw text files
+    stopwords : iterable, None
+    repeat : int
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per file with size, timings and per-MB speedup
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Benchmarking text pre-processing.")
+
+    if stopwords is None:
+        stopwords = nlp_dicts.stopwords_bbc_monitoring
+
+    kwargs = dict(
+        char_count_filter=True, stopwords=stopwords, min_len=3, max_len=15
+    )
+
+    rows = []
+    for file_path in file_list:
+        with open(file_path) as f:
+            text = f.read()
+
+        size_mb = len(text.encode("utf-8")) / 1e6
+        t_reference = _best_of(
+            make_corpus.preprocess_text, repeat, text, **kwargs
+        )
+        t_fused = _best_of(
+            make_corpus.preprocess_text_fused, repeat, text, **kwargs
+        )
+        rows.append(
+            {
+                "file": os.path.basename(file_path),
+                "size_mb": size_mb,
+                "reference_s": t_reference,
+                "fused_s": t_fused,
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    df["reference_s_per_mb"] = df["reference_s"] / df["size_mb"]
+    df["fused_s_per_mb"] = df["fused_s"] / df["size_mb"]
+    df["speedup"] = df["reference_s"] / df["fused_s"]
+
+    logger.info(
+        "Pre-processing: {:.3f} s/MB (reference) vs. {:.3f} s/MB (fused), "
+        "speedup {:.2f}x.".format(
+            df["reference_s"].sum() / df["size_mb"].sum(),
+            df["fused_s"].sum() / df["size_mb"].sum(),
+            df["reference_s"].sum() / df["fused_s"].sum(),
+        )
+    )
+
+    return df
+
+
+def compare_nlp_backends(
+    file_list, backends=("full", "lean"), stopwords=None, chunk_size=None
+):
+    """
+    Build the terms lists of ``extract.tokenize_corpus`` for the same raw
+    files with two spaCy backends (see ``make_corpus.NLP_BACKENDS``) and
+    report where they differ.
+
+    Parameters
+    ----------
+    file_list : list
+        raw text files
+    backends : tuple
+        (reference, candidate)
+    stopwords : iterable, None
+    chunk_size : int, None
+
+    Returns
+    -------
+    df_files : pd.DataFrame
+        per file: number of terms and unique terms for each backend, the
+        Jaccard similarity of the unique terms and the overlap of the term
+        counts (sum of minima over sum of maxima)
+    df_terms : pd.DataFrame
+        per term with differing counts: counts for each backend and their
+        difference, sorted by absolute difference
+    """
+    from src.features import extract
+
+    logger = logging.getLogger(__name__)
+
+    if stopwords is None:
+        stopwords = nlp_dicts.stopwords_bbc_monitoring
+
+    term_counts = {}
+    for backend in backends:
+        logger.info("Extracting terms with the {} backend.".format(backend))
+        nlp = make_corpus.load_nlp(
+            backend=backend,
+            max_length=None if chunk_size else int(30 * 1e6),
+        )
+        docs = make_corpus.process_files(
+            file_list,
+            nlp=nlp,
+            specific_stopwords=stopwords,
+            chunk_size=chunk_size,
+        )
+        term_counts[backend] = [
+            collections.Counter(terms)
+            for terms, _ in extract.iter_doc_terms(
+                docs,
+                ngrams=(1, 2),
+                normalize="lemma",
+                as_strings=True,
+                filter_stops=True,
+                filter_nums=True,
+                include_pos={"ADJ", "NOUN", "VERB"},
+                min_freq=2,
+            )
+        ]
+
+    reference, candidate = backends
+    rows = []
+    totals = {backend: collections.Counter() for backend in backends}
+    for file_path, counts_ref, counts_cand in zip(
+        file_list, term_counts[reference], term_counts[candidate]
+    ):
+        totals[reference].update(counts_ref)
+        totals[candidate].update(counts_cand)
+
+        types_ref, types_cand = set(counts_ref), set(counts_cand)
+        n_union = max(len(types_ref | types_cand), 1)
+        rows.append(
+            {
+                "file": os.path.basename(file_path),
+                "n_terms_" + reference: sum(counts_ref.values()),
+                "n_terms_" + candidate: sum(counts_cand.values()),
+                "n_types_" + reference: len(types_ref),
+                "n_types_" + candidate: len(types_cand),
+                "jaccard": len(types_ref & types_cand) / n_union,
+                "count_overlap": sum((counts_ref & counts_cand).values())
+                / max(sum((counts_ref | counts_cand).values()), 1),
+            }
+        )
+    df_files = pd.DataFrame(rows)
+
+    df_terms = pd.DataFrame(
+        {reference: totals[reference], candidate: totals[candidate]}
+    ).fillna(0)
+    df_terms["diff"] = df_terms[candidate] - df_terms[reference]
+    df_terms = df_terms[df_terms["diff"] != 0]
+    df_terms = df_terms.reindex(
+        df_terms["diff"].abs().sort_values(ascending=False).index
+    )
+
+    logger.info(
+        "{} vs. {}: mean Jaccard {:.4f}, {} terms differ in count.".format(
+            reference, candidate, df_files["jaccard"].mean(), len(df_terms)
+        )
+    )
+
+    return df_files, df_terms
+
+
+def benchmark_import(module="src.pipeline", repeat=5, cwd=None):
+    """
+    Start-up time of importing ``module`` in a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+    repeat : int
+    cwd : str, None
+        working directory, the project directory by default
+
+    Returns
+    -------
+    timings : list
+        wall time in seconds per run
+    """
+    logger = logging.getLogger(__name__)
+
+    if cwd is None:
+        cwd = Path(__file__).resolve().parents[2]
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", "import {}".format(module)],
+            cwd=cwd,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+
+    logger.info(
+        "Importing {}: best {:.3f} s, mean {:.3f} s.".format(
+            module, min(timings), sum(timings) / len(timings)
+        )
+    )
+
+    return timings
+
+
+def import_time_breakdown(module="src.pipeline", cwd=None):
+    """
+    Per-package import times of ``module`` as reported by
+    ``python -X importtime``.
+
+    Returns
+    -------
+    pd.DataFrame
+        self and cumulative import time in seconds per imported package,
+        sorted by cumulative time
+    """
+    if cwd is None:
+        cwd = Path(__file__).resolve().parents[2]
+
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        cwd=cwd,
+        check=True,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:") :].split(
+            "|"
+        )
+        rows.append(
+            {
+                "package": package.strip(),
+                "self_s": int(self_us) / 1e6,
+                "cumulative_s": int(cumulative_us) / 1e6,
+            }
+        )
+
+    return pd.DataFrame(rows).sort_values("cumulative_s", ascending=False)
+
+
+def benchmark_inference(projector, texts, batch_sizes=(1, 8, 32), repeat=3):
+    """
+    Throughput and latency of ``predict_model.TopicProjector.transform``
+    when texts arrive in batches of different sizes.
+
+    Parameters
+    ----------
+    projector : predict_model.TopicProjector
+    texts : list
+        raw texts
+    batch_sizes : iterable
+    repeat : int
+        passes over ``texts`` per batch size
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per batch size: docs per second and latency percentiles
+        per batch
+    """
+    logger = logging.getLogger(__name__)
+    logger.info("Benchmarking topic inference.")
+
+    # warm-up, e.g. lazily loaded spaCy components
+    projector.transform(texts[:1])
+
+    rows = []
+    for batch_size in batch_sizes:
+        latencies = []
+        for _ in range(repeat):
+            for start in range(0, len(texts), batch_size):
+                batch = texts[start : start + batch_size]
+                t_start = time.perf_counter()
+                projector.transform(batch, batch_size=batch_size)
+                latencies.append(time.perf_counter() - t_start)
+
+        rows.append(
+            {
+                "batch_size": batch_size,
+                "docs_per_s": repeat * len(texts) / np.sum(latencies),
+                "latency_p50_ms": 1e3 * np.percentile(latencies, 50),
+                "latency_p99_ms": 1e3 * np.percentile(latencies, 99),
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def _time_and_peak_memory(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def benchmark_group_term_matrix(dirpath):
+    """
+    Wall time and peak memory (tracemalloc) of building the group-term
+    matrix from persisted term streams, with ``GroupVectorizer`` on the
+    decoded strings vs. ``group_vectorizer_fit_transform_term_ids``.
+
+    Parameters
+    ----------
+    dirpath : str
+        term streams directory, see ``extract.write_term_streams``
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per method
+    """
+    from src.data import io
+    from src.models import train_model
+
+    logger = logging.getLogger(__name__)
+    logger.info("Benchmarking group-term matrix construction.")
+
+    def from_strings():
+        tokenized_docs, basin_group, _ = io.read_term_streams(dirpath)
+        # decoded as in the pipeline, lazily while counting
+        train_model.group_vectorizer().fit_transform(
+            tokenized_docs, basin_group
+        )
+
+    def from_term_ids():
+        train_model.group_vectorizer_fit_transform_term_ids(
+            train_model.group_vectorizer(), dirpath, save=False
+        )
+
+    rows = []
+    for method, func in [
+        ("strings", from_strings),
+        ("term_ids", from_term_ids),
+    ]:
+        time_s, peak_memory_mb = _time_and_peak_memory(func)
+        rows.append(
+            {
+                "method": method,
+                "time_s": time_s,
+                "peak_memory_mb": peak_memory_mb,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def benchmark_nmf_warm_start(grp_term_matrix, n_topics_list):
+    """
+    Iterations, wall time and reconstruction error of NMF fits for each
+    number of topics, warm-started along ``n_topics_list`` (see
+    ``predict_model.nmf_warm_start_sweep``) vs. fitted from scratch.
+
+    Parameters
+    ----------
+    grp_term_matrix : scipy.sparse.csr_matrix
+    n_topics_list : list
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per number of topics, one column per init and measure
+    """
+    from src.models import predict_model
+
+    logger = logging.getLogger(__name__)
+    logger.info("Benchmarking warm-started NMF.")
+
+    _, report = predict_model.nmf_warm_start_sweep(
+        grp_term_matrix, n_topics_list, cold_baseline=True
+    )
+    df = report.pivot(index="n_topics", columns="init")
+    df.columns = ["{}_{}".format(init, col) for col, init in df.columns]
+
+    return df
+
+
+def benchmark_corpus_loading(corpus_fpath, indexed_dirpath, nlp, predicate):
+    """
+    Time and peak memory (tracemalloc) of loading the docs selected by
+    ``predicate`` on their metadata, from a full ``textacy.Corpus`` file
+    vs. an indexed corpus of the same docs, plus a metadata-only query of
+    the indexed corpus.
+
+    Parameters
+    ----------
+    corpus_fpath : str
+        corpus saved by ``textacy.Corpus.save``
+    indexed_dirpath : str
+        indexed corpus, see ``io.IndexedCorpusWriter``
+    nlp : spaCy
+    predicate : callable
+        e.g. ``lambda meta: meta["basin"] == "Nile"``
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per method
+    """
+    from src.data import io
+
+    logger = logging.getLogger(__name__)
+    logger.info("Benchmarking corpus loading.")
+
+    def full():
+        corpus = io.read_corpus(corpus_fpath, language_model=nlp)
+        return [doc for doc in corpus if predicate(doc._.meta)]
+
+    def indexed():
+        with io.IndexedCorpus(indexed_dirpath, nlp) as corpus:
+            return list(corpus.filter(predicate))
+
+    def indexed_meta_only():
+        with io.IndexedCorpus(indexed_dirpath, nlp) as corpus:
+            return corpus.filter(predicate).meta
+
+    rows = []
+    for method, func in [
+        ("full", full),
+        ("indexed", indexed),
+        ("indexed_meta_only", indexed_meta_only),
+    ]:
+        time_s, peak_memory_mb = _time_and_peak_memory(func)
+        rows.append(
+            {
+                "method": method,
+                "time_s": time_s,
+                "peak_memory_mb": peak_memory_mb,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    project_dir = Path(__file__).resolve().parents[2]
+    data_raw = os.path.join(project_dir, "data", "raw")
+    file_list = sorted(
+        glob.glob(os.path.join(data_raw, "BBC_2007_07_04_TXT_V2", "*.txt"))
+    )
+
+    print(benchmark_preprocess(file_list).to_string())
+
+    df_files, df_terms = compare_nlp_backends(file_list, chunk_size=int(5e5))
+    print(df_files.describe().to_string())
+    print(df_terms.head(50).to_string())
+
+    benchmark_import("src.pipeline")
+    print(import_time_breakdown("src.pipeline").head(20).to_string())
+
+    from src import pipeline
+    from src.data import io
+    from src.models import predict_model
+
+    if os.path.exists(pipeline.fpath_gt_matrix()):
+        grp_term_matrix = io.read_group_term_matrix(pipeline.fpath_gt_matrix())
+        print(
+            benchmark_nmf_warm_start(
+                grp_term_matrix, list(range(2, 10))
+            ).to_string()
+        )
+
+    model_fpath = pipeline.fpath_topic_model("nmf", 5)
+    if os.path.exists(model_fpath):
+        projector = predict_model.TopicProjector.from_files(
+            pipeline.fpath_vectorizer(),
+            model_fpath,
+            backend=pipeline.nlp_backend,
+        )
+        texts = []
+        for file_path in file_list:
+            with open(file_path) as f:
+                # daily report sized excerpts
+                texts.append(f.read()[:10000])
+        print(benchmark_inference(projector, texts).to_string())
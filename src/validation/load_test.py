@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+import json
+import time
+import logging
+import urllib.request
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+def _post_texts(url, texts, timeout=60):
+    body = json.dumps({"texts": texts}).encode("utf-8")
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def load_test(
+    texts,
+    url="http://127.0.0.1:8000/topics",
+    n_requests=200,
+    concurrency=16,
+    texts_per_request=1,
+):
+    """
+    Load test of the scoring server (see ``serve_model``): ``n_requests``
+    requests of ``texts_per_request`` texts each, cycling through
+    ``texts``, sent by ``concurrency`` concurrent clients.
+
+    Parameters
+    ----------
+    texts : list
+        raw texts
+    url : str
+    n_requests : int
+    concurrency : int
+    texts_per_request : int
+
+    Returns
+    -------
+    dict
+        requests per second, p50/p99 latency of the successful requests
+        (NaN if all failed) and number of failed requests
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(
+        "Load test of {} with {} concurrent clients.".format(url, concurrency)
+    )
+
+    payloads = [
+        [
+            texts[(i * texts_per_request + j) % len(texts)]
+            for j in range(texts_per_request)
+        ]
+        for i in range(n_requests)
+    ]
+
+    latencies, n_failed = [], 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        futures = [
+            executor.submit(_post_texts, url, payload) for payload in payloads
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                latencies.append(future.result())
+            except OSError:
+                n_failed += 1
+    elapsed = time.perf_counter() - start
+
+    if n_failed:
+        logger.warning(
+            "{} of {} requests failed.".format(n_failed, n_requests)
+        )
+
+    # no latencies if every request failed
+    p50, p99 = np.nan, np.nan
+    if latencies:
+        p50, p99 = 1e3 * np.percentile(latencies, [50, 99])
+
+    return {
+        "concurrency": concurrency,
+        "texts_per_request": texts_per_request,
+        "requests_per_s": len(latencies) / elapsed,
+        "latency_p50_ms": p50,
+        "latency_p99_ms": p99,
+        "n_failed": n_failed,
+    }
+
+
+if __name__ == "__main__":
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    # requires a running server: python -m src.models.serve_model
+    project_dir = Path(__file__).resolve().parents[2]
+    data_raw = os.path.join(project_dir, "data", "raw")
+    texts = []
+    for file_path in sorted(
+        glob.glob(os.path.join(data_raw, "BBC_2007_07_04_TXT_V2", "*.txt"))
+    ):
+        with open(file_path) as f:
+            # daily report sized excerpts
+            texts.append(f.read()[:10000])
+
+    print(
+        pd.DataFrame(
+            [
+                load_test(texts, concurrency=concurrency)
+                for concurrency in (1, 4, 16, 64)
+            ]
+        ).to_string()
+    )
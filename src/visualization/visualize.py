@@ -1,35 +1,22 @@
 # -*- coding: utf-8 -*-
 import os
 import logging
-import pandas as pd
 import matplotlib.pyplot as plt
+from src.data import tables
+from src.features import corpus_stats
 
 
-def word_counts(corpus, data_dir=None, figure_dir=None, version=None, n=30):
+def word_counts(
+    corpus, data_dir=None, figure_dir=None, version=None, n=30, df_stats=None
+):
     logger = logging.getLogger(__name__)
     logger.info("Visualising word counts.")
 
-    # calc
-    word_counts_wcount = corpus.word_counts(
-        weighting="count", as_strings=True, filter_nums=True, normalize="lemma"
-    )
-    word_counts_wfreq = corpus.word_counts(
-        weighting="freq", as_strings=True, filter_nums=True, normalize="lemma"
-    )
-
-    # df
-    df_word_counts_wcount = pd.DataFrame.from_dict(
-        data=word_counts_wcount, orient="index", columns=["count"]
-    )
-    df_word_counts_wfreq = pd.DataFrame.from_dict(
-        data=word_counts_wfreq, orient="index", columns=["freq"]
-    )
+    # calc, see corpus_stats.corpus_statistics
+    if df_stats is None:
+        df_stats = corpus_stats.corpus_statistics(corpus)
 
-    # merge
-    if (df_word_counts_wfreq.index == df_word_counts_wcount.index).all():
-        df_word_counts = pd.concat(
-            [df_word_counts_wcount, df_word_counts_wfreq], axis=1
-        )
+    df_word_counts = df_stats[["count", "freq"]]
 
     # sanity check
     assert (
@@ -46,15 +33,26 @@ def word_counts(corpus, data_dir=None, figure_dir=None, version=None, n=30):
 
     # save
     if data_dir is not None:
-        df_word_counts.to_pickle(
+        # columnar, sorted by count for top-N reads, see tables.read_table
+        tables.write_table(
+            df_word_counts,
             os.path.join(
                 data_dir,
-                "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDCOUNT.pkl".format(
+                "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDCOUNT.parquet".format(
                     version
                 ),
-            )
+            ),
         )
 
+    # plot
+    ax = plot_word_counts(
+        df_word_counts, figure_dir=figure_dir, version=version, n=n
+    )
+
+    return ax, df_word_counts
+
+
+def plot_word_counts(df_word_counts, figure_dir=None, version=None, n=30):
     # plot
     ax = df_word_counts.head(n).plot.bar(
         sharex=True, subplots=True, color="grey", legend=False
@@ -74,50 +72,23 @@ def word_counts(corpus, data_dir=None, figure_dir=None, version=None, n=30):
             bbox_inches="tight",
         )
 
-    return ax, df_word_counts
+    return ax
 
 
 def word_document_counts(
-    corpus, data_dir=None, figure_dir=None, version=None, n=30
+    corpus, data_dir=None, figure_dir=None, version=None, n=30, df_stats=None
 ):
     logger = logging.getLogger(__name__)
     logger.info("Visualising word-document counts.")
 
-    # calc
-    word_doc_counts_wfreq = corpus.word_doc_counts(
-        weighting="freq", as_strings=True, normalize="lemma"
-    )
-    word_doc_counts_wcount = corpus.word_doc_counts(
-        weighting="count", as_strings=True, normalize="lemma"
-    )
-    word_doc_counts_widf = corpus.word_doc_counts(
-        weighting="idf", as_strings=True, normalize="lemma"
-    )
+    # calc, see corpus_stats.corpus_statistics
+    if df_stats is None:
+        df_stats = corpus_stats.corpus_statistics(corpus)
 
-    # df
-    df_word_doc_counts_wfreq = pd.DataFrame.from_dict(
-        data=word_doc_counts_wfreq, orient="index", columns=["freq"]
-    )
-    df_word_doc_counts_wcount = pd.DataFrame.from_dict(
-        data=word_doc_counts_wcount, orient="index", columns=["count"]
-    )
-    df_word_doc_counts_widf = pd.DataFrame.from_dict(
-        data=word_doc_counts_widf, orient="index", columns=["idf"]
+    df_word_doc_counts = df_stats[["doc_count", "doc_freq", "idf"]].rename(
+        columns={"doc_count": "count", "doc_freq": "freq"}
     )
 
-    # merge
-    if (
-        df_word_doc_counts_wfreq.index == df_word_doc_counts_wcount.index
-    ).all():
-        df_word_doc_counts = pd.concat(
-            [
-                df_word_doc_counts_wcount,
-                df_word_doc_counts_wfreq,
-                df_word_doc_counts_widf,
-            ],
-            axis=1,
-        )
-
     # sanity check
     assert (
         (
@@ -134,15 +105,28 @@ def word_document_counts(
     )
 
     if data_dir is not None:
-        df_word_doc_counts.to_pickle(
+        # columnar, sorted by count for top-N reads, see tables.read_table
+        tables.write_table(
+            df_word_doc_counts,
             os.path.join(
                 data_dir,
-                "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDDOCCOUNT.pkl".format(
+                "BBC_2007_07_04_CORPUS_TEXTACY_{}_WORDDOCCOUNT.parquet".format(
                     version
                 ),
-            )
+            ),
         )
 
+    # plot
+    ax = plot_word_document_counts(
+        df_word_doc_counts, figure_dir=figure_dir, version=version, n=n
+    )
+
+    return ax, df_word_doc_counts
+
+
+def plot_word_document_counts(
+    df_word_doc_counts, figure_dir=None, version=None, n=30
+):
     # plot
     ax = df_word_doc_counts.head(n).plot.bar(
         sharex=True, subplots=True, color="grey", legend=False
@@ -162,4 +146,4 @@ def word_document_counts(
             bbox_inches="tight",
         )
 
-    return ax, df_word_doc_counts
+    return ax
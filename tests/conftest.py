@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+import spacy
+import textacy  # noqa: F401, registers doc._.meta
+
+# (basin, year, month, text) of small synthetic docs
+DOC_RECORDS = [
+    ("Nile", "2001", "03", "The dam on the Nile holds back water."),
+    ("Nile", "2001", np.nan, "Egypt and Sudan signed a water treaty."),
+    ("Mekong", "2001", "07", "Floods on the Mekong damaged the river banks."),
+    ("Nile", "2002", "01", "Ethiopia plans a new dam for hydro power."),
+    ("Indus", "2003", np.nan, "Drought hit farmers along the Indus basin."),
+    ("Mekong", "2004", "11", "The river commission met on water sharing."),
+]
+
+# raw files named like the BBC Monitoring files, see parse_file_name
+RAW_FILES = {
+    "Indus_2003.txt": (
+        "Drought hit farmers along the Indus basin.\n\n"
+        "The water treaty between India and Pakistan was discussed again. "
+        "Officials met to talk about the river flow and new canals."
+    ),
+    "Mekong_2001_07.txt": (
+        "Floods on the Mekong damaged the river banks.\n\n"
+        "The river commission met on water sharing and new dams."
+    ),
+    "Nile_2001.txt": (
+        "The dam on the Nile holds back water.\n"
+        "Egypt and Sudan signed a water treaty.\n\n"
+        "Ethiopia plans a new dam for hydro power on the Blue Nile."
+    ),
+    "Nile_2001_03.txt": "Talks on the Nile water sharing failed in March.",
+}
+
+
+@pytest.fixture(scope="session")
+def nlp():
+    # no statistical model needed, tokens and metadata are compared
+    return spacy.blank("en")
+
+
+@pytest.fixture
+def docs(nlp):
+    docs = []
+    for basin, year, month, text in DOC_RECORDS:
+        doc = nlp(text)
+        doc._.meta = {"basin": basin, "year": year, "month": month}
+        docs.append(doc)
+    return docs
+
+
+@pytest.fixture
+def raw_dir(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for fname, text in RAW_FILES.items():
+        (raw_dir / fname).write_text(text)
+    return raw_dir
+
+
+@pytest.fixture
+def file_list(raw_dir):
+    return sorted(str(file_path) for file_path in raw_dir.glob("*.txt"))
+
+
+@pytest.fixture(scope="session")
+def doc_signatures():
+    # what downstream stages read from a doc: tokens, lemmas, tags, metadata
+    def signatures(docs):
+        return [
+            (
+                [token.orth_ for token in doc],
+                [token.lemma_ for token in doc],
+                [token.tag_ for token in doc],
+                {
+                    key: None if pd.isna(value) else value
+                    for key, value in doc._.meta.items()
+                },
+            )
+            for doc in docs
+        ]
+
+    return signatures
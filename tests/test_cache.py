@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+from src.data import cache
+
+MODULE = '''
+CONSTANT = 1
+
+
+def helper():
+    return CONSTANT
+
+
+def unused():
+    return 2
+
+
+class Model:
+    def fit(self):
+        return self._step() + helper()
+
+    def _step(self):
+        return 0
+
+    def plot(self):
+        return unused()
+'''
+
+
+@pytest.fixture
+def fpath(tmp_path):
+    fpath = tmp_path / "module.py"
+    fpath.write_text(MODULE)
+    return str(fpath)
+
+
+def test_source_names(fpath):
+    assert cache.source_names(fpath, ["Model.fit"]) == [
+        "CONSTANT",
+        "Model._step",
+        "Model.fit",
+        "helper",
+    ]
+
+
+def test_source_names_missing(fpath):
+    with pytest.raises(KeyError):
+        cache.source_names(fpath, ["missing"])
+
+
+def test_source_digest(fpath):
+    names = cache.source_names(fpath, ["Model.fit"])
+    digest = cache.source_digest(fpath, names=names)
+    digest_module = cache.source_digest(fpath)
+
+    # a change outside the names only changes the digest of the module
+    with open(fpath, "a") as f:
+        f.write("\n\nOTHER = 3\n")
+    assert cache.source_digest(fpath, names=names) == digest
+    assert cache.source_digest(fpath) != digest_module
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import pandas.testing as pdt
+import pytest
+from src.features import corpus_stats
+
+
+def assert_tables_equal(actual, expected):
+    # same terms and columns, values equal up to float rounding
+    pdt.assert_frame_equal(
+        actual.sort_index(), expected.sort_index(), check_dtype=False
+    )
+
+
+def test_aggregate_equals_corpus_statistics(docs):
+    stats = corpus_stats.grouped_corpus_statistics(docs)
+    assert_tables_equal(
+        stats.aggregate().table(), corpus_stats.corpus_statistics(docs)
+    )
+
+
+@pytest.mark.parametrize("basin", ["Nile", "Mekong", "Indus"])
+def test_select_equals_corpus_statistics(docs, basin):
+    stats = corpus_stats.grouped_corpus_statistics(docs)
+    assert_tables_equal(
+        stats.select(basin=basin).table(),
+        corpus_stats.corpus_statistics(
+            doc for doc in docs if doc._.meta["basin"] == basin
+        ),
+    )
+
+
+def test_grouped_statistics_round_trip(tmp_path, docs):
+    stats = corpus_stats.grouped_corpus_statistics(docs)
+    dirpath = str(tmp_path / "stats")
+    corpus_stats.write_grouped_statistics(stats, dirpath)
+    reloaded = corpus_stats.read_grouped_statistics(dirpath)
+
+    assert (reloaded.counts != stats.counts).nnz == 0
+    assert (reloaded.doc_counts != stats.doc_counts).nnz == 0
+    assert list(reloaded.terms) == list(stats.terms)
+    pdt.assert_frame_equal(reloaded.groups, stats.groups, check_dtype=False)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import collections
+import pytest
+from references import nlp_dicts
+from src.data import io, make_corpus
+from src.features import extract
+
+STREAMS = [
+    ([], [], []),
+    ([["nile", "nile basin"], [], ["basin"]], ["Nile"] * 3, ["2001"] * 3),
+    (
+        [["dam", "water", "dam"], ["water", "river"], ["dam river"]],
+        ["Nile", "Mekong", "Nile"],
+        ["2001", "2001", "2002"],
+    ),
+]
+
+
+@pytest.mark.parametrize("tokenized_docs, basin_group, year_group", STREAMS)
+def test_term_stream_round_trip(
+    tmp_path, tokenized_docs, basin_group, year_group
+):
+    dirpath = str(tmp_path / "terms")
+    extract.write_term_streams(
+        tokenized_docs, basin_group, year_group, dirpath=dirpath
+    )
+
+    docs_read, basins_read, years_read = io.read_term_streams(
+        dirpath, mmap_mode=None
+    )
+    assert list(docs_read) == tokenized_docs
+    assert basins_read == basin_group
+    assert years_read == year_group
+
+    vocabulary, term_ids, doc_offsets, _ = io.read_term_ids(
+        dirpath, mmap_mode=None
+    )
+    assert sorted(vocabulary) == sorted(
+        {term for terms in tokenized_docs for term in terms}
+    )
+    assert len(doc_offsets) == len(tokenized_docs) + 1
+    assert doc_offsets[0] == 0
+    assert doc_offsets[-1] == len(term_ids)
+
+
+# spacy.blank has no tagger, terms are not filtered by part-of-speech
+TERMS_KWARGS = dict(
+    entities=False,
+    normalize="lower",
+    filter_stops=True,
+    filter_nums=True,
+    include_pos=None,
+)
+
+
+@pytest.fixture
+def process_files(nlp, file_list):
+    def process(chunk_size=None):
+        return list(
+            make_corpus.process_files(
+                file_list,
+                nlp=nlp,
+                specific_stopwords=nlp_dicts.stopwords_bbc_monitoring,
+                chunk_size=chunk_size,
+            )
+        )
+
+    return process
+
+
+def test_file_terms_list_single_doc(process_files):
+    for doc in process_files():
+        assert extract._file_terms_list(
+            [doc], 2, ngrams=(1, 2), as_strings=True, **TERMS_KWARGS
+        ) == list(
+            doc._.to_terms_list(
+                ngrams=(1, 2), min_freq=2, as_strings=True, **TERMS_KWARGS
+            )
+        )
+
+
+@pytest.mark.parametrize("chunk_size", [20, 60])
+def test_tokenize_chunked_docs(file_list, process_files, chunk_size):
+    chunked_docs = process_files(chunk_size=chunk_size)
+    assert len(chunked_docs) > len(file_list)
+
+    # the chunks of a file give a single terms list
+    unigrams_full, unigrams_chunked = [
+        extract.tokenize_corpus(docs, ngrams=1, min_freq=1, **TERMS_KWARGS)[0]
+        for docs in [process_files(), chunked_docs]
+    ]
+    assert [list(terms) for terms in unigrams_chunked] == [
+        list(terms) for terms in unigrams_full
+    ]
+
+    # only bigrams spanning a chunk boundary are missing
+    terms_full, terms_chunked = [
+        extract.tokenize_corpus(
+            docs, ngrams=(1, 2), min_freq=1, **TERMS_KWARGS
+        )[0]
+        for docs in [process_files(), chunked_docs]
+    ]
+    for full, chunked in zip(terms_full, terms_chunked):
+        assert not collections.Counter(chunked) - collections.Counter(full)
+
+
+@pytest.mark.parametrize("n_docs", [0, 1, 6])
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_tokenize_corpus_parallel_equivalence(docs, n_docs, batch_size):
+    def tokenize(n_process):
+        tokenized_docs, basin_group, year_group = extract.tokenize_corpus(
+            docs[:n_docs],
+            min_freq=1,
+            n_process=n_process,
+            batch_size=batch_size,
+            **TERMS_KWARGS
+        )
+        return (
+            [list(terms) for terms in tokenized_docs],
+            list(basin_group),
+            list(year_group),
+        )
+
+    assert tokenize(2) == tokenize(1)
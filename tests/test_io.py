@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+import math
+import pytest
+from references import nlp_dicts
+from src.data import io, make_corpus
+
+
+@pytest.fixture
+def dirpath(tmp_path, docs):
+    dirpath = str(tmp_path / "indexed")
+    with io.IndexedCorpusWriter(dirpath) as writer:
+        for doc in docs:
+            writer.add(doc)
+    return dirpath
+
+
+def test_indexed_corpus_round_trip(dirpath, nlp, docs, doc_signatures):
+    with io.IndexedCorpus(dirpath, nlp) as corpus:
+        assert doc_signatures(corpus) == doc_signatures(docs)
+        assert doc_signatures([corpus[3]]) == doc_signatures(docs[3:4])
+        assert corpus.n_tokens == sum(len(doc) for doc in docs)
+
+
+@pytest.mark.parametrize(
+    "conditions, predicate",
+    [
+        ({"basin": "Nile"}, lambda meta: meta["basin"] == "Nile"),
+        (
+            {"basin": ["Nile", "Indus"], "year": (2001, 2002)},
+            lambda meta: meta["basin"] in ("Nile", "Indus")
+            and 2001 <= int(meta["year"]) <= 2002,
+        ),
+        ({"year": 2005}, lambda meta: False),
+    ],
+)
+def test_indexed_corpus_query(dirpath, nlp, conditions, predicate):
+    with io.IndexedCorpus(dirpath, nlp) as corpus:
+        assert (
+            corpus.query(**conditions).indices.tolist()
+            == corpus.filter(predicate).indices.tolist()
+        )
+
+        # the views of queries of a view stay within it
+        view = corpus.take(corpus.indices[::2])
+        assert (
+            view.query(**conditions).indices.tolist()
+            == view.filter(predicate).indices.tolist()
+        )
+
+
+def test_indexed_corpus_close(dirpath, nlp, docs, doc_signatures):
+    corpus = io.IndexedCorpus(dirpath, nlp)
+    view = corpus.take([0, 2])
+    with corpus:
+        view[0]
+        assert corpus._mmaps
+    # views share the memory map
+    assert not view._mmaps
+
+    # mapped again on access
+    assert doc_signatures([view[1]]) == doc_signatures(docs[2:3])
+    view.close()
+    assert not corpus._mmaps
+
+
+def test_failed_rebuild_keeps_corpus(dirpath, nlp, docs):
+    with pytest.raises(RuntimeError):
+        with io.IndexedCorpusWriter(dirpath) as writer:
+            writer.add(docs[0])
+            raise RuntimeError("failed rebuild")
+
+    assert not os.path.exists(dirpath + ".tmp")
+    with io.IndexedCorpus(dirpath, nlp) as corpus:
+        assert len(corpus) == len(docs)
+
+
+@pytest.mark.parametrize("shard_size", [1, 2, 3])
+def test_corpus_shard_round_trip(
+    tmp_path, nlp, raw_dir, doc_signatures, shard_size
+):
+    kwargs = dict(
+        input_filepath=str(raw_dir / "*.txt"),
+        nlp=nlp,
+        specific_stopwords=nlp_dicts.stopwords_bbc_monitoring,
+    )
+    fpath = str(tmp_path / "corpus.bin.gz")
+    dirpath = str(tmp_path / "shards")
+
+    make_corpus.create_corpus(output_filepath=fpath, **kwargs)
+    # shards left over from the earlier build would show up
+    make_corpus.create_corpus(output_filepath=dirpath, shard_size=1, **kwargs)
+    make_corpus.create_corpus(
+        output_filepath=dirpath, shard_size=shard_size, **kwargs
+    )
+
+    expected = list(io.read_corpus(fpath, language_model=nlp))
+    assert doc_signatures(
+        io.iter_corpus_shards(dirpath, language_model=nlp)
+    ) == doc_signatures(expected)
+    assert len(
+        glob.glob(os.path.join(dirpath, "shard_*.bin.gz"))
+    ) == math.ceil(len(expected) / shard_size)
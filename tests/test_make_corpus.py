@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import io
+import pytest
+from references import nlp_dicts
+from src.data import make_corpus
+
+# edge cases for the pre-processing equivalence: accents, ligatures,
+# compatibility characters, replacements and whitespace variants
+PREPROCESSING_CASES = [
+    "",
+    "   ",
+    "Water WATER water",
+    "Café, Niño and Ångström déjà-vu",
+    "The ﬁnancial agreement on the Nile – signed 12.03.1999 – failed.",
+    "US$ 5,000,000 or €3.5m or £12 for the dam",
+    "Contact: monitoring@bbc.co.uk, +44 (0)20 7946 0958 or 555-1234",
+    "See https://www.example.org/path?q=1 and www.example.com",
+    "#Mekong @user_handle #water2020 ＃fullwidth",
+    "Emojis 🌊💧 and symbols ™ © ℌ \u212a (kelvin) \u0130stanbul",
+    "hydro-\n  electric trans-\nboundary co-operation",
+    "Tabs\tand\r\nline\x0bbreaks non-breaking   spaces",
+    "“Quoted” ‘text’ with ´accents´ and `ticks`",
+    "Numbers 1,000.50 and 1 000 and 3.14 and -42 and 2nd 3rd",
+    "Кириллица and العربية and 中文 mixed with ASCII words",
+    "snake_case_words and UPPER_CASE and _leading underscores_",
+    "aa bbb cccccccccccccccc ddddddddddddddd eeeeeeeeeeeeeeee",
+    "january march reuters said the ministry",
+]
+
+SPLIT_CASES = [
+    "",
+    "short",
+    "one. two. three. four. five. six.",
+    "first paragraph\n\nsecond paragraph\nwith lines\n\nthird",
+    "x" * 95,
+    "words " * 40 + "\n\n" + "y" * 30 + ". end",
+]
+
+
+@pytest.mark.parametrize("text", PREPROCESSING_CASES)
+@pytest.mark.parametrize("min_len, max_len", [(2, 15), (3, 15)])
+def test_preprocess_text_fused_equivalence(text, min_len, max_len):
+    kwargs = dict(
+        char_count_filter=True,
+        stopwords=nlp_dicts.stopwords_bbc_monitoring,
+        min_len=min_len,
+        max_len=max_len,
+    )
+    assert make_corpus.preprocess_text_fused(
+        text, **kwargs
+    ) == make_corpus.preprocess_text(text, **kwargs)
+
+
+def test_preprocess_text_fused_requires_stopwords():
+    with pytest.raises(NotImplementedError):
+        make_corpus.preprocess_text_fused("text", stopwords=None)
+
+
+@pytest.mark.parametrize("text", SPLIT_CASES)
+@pytest.mark.parametrize("chunk_size", [1, 7, 20, 100])
+def test_split_text(text, chunk_size):
+    chunks = make_corpus.split_text(text, chunk_size)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+
+
+def test_split_text_prefers_paragraphs():
+    text = "first paragraph\n\nsecond paragraph"
+    assert make_corpus.split_text(text, 20) == [
+        "first paragraph\n\n",
+        "second paragraph",
+    ]
+
+
+@pytest.mark.parametrize("text", SPLIT_CASES)
+@pytest.mark.parametrize("chunk_size", [1, 7, 20, 100])
+def test_iter_split_file(text, chunk_size):
+    chunks = list(make_corpus.iter_split_file(io.StringIO(text), chunk_size))
+
+    assert "".join(chunks) == text
+    assert all(0 < len(chunk) <= chunk_size for chunk in chunks)
+
+
+def test_iter_raw_records(tmp_path):
+    text = "first paragraph\n\nsecond paragraph"
+    file_path = tmp_path / "Nile_2001_03.txt"
+    file_path.write_text(text)
+
+    (record,) = make_corpus.iter_raw_records(str(file_path))
+    assert record[0] == text
+    assert record[1]["basin"] == "Nile"
+
+    records = list(make_corpus.iter_raw_records(str(file_path), 20))
+    assert "".join(chunk for chunk, _ in records) == text
+    assert [metadata["chunk"] for _, metadata in records] == [0, 1]
+    assert all(metadata["month"] == "03" for _, metadata in records)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 60])
+def test_process_files_parallel_equivalence(
+    nlp, file_list, doc_signatures, chunk_size
+):
+    docs = {
+        n_process: list(
+            make_corpus.process_files(
+                file_list,
+                nlp=nlp,
+                specific_stopwords=nlp_dicts.stopwords_bbc_monitoring,
+                n_process=n_process,
+                chunk_size=chunk_size,
+            )
+        )
+        for n_process in (1, 2)
+    }
+    assert doc_signatures(docs[2]) == doc_signatures(docs[1])
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_update_corpus_equivalence(
+    tmp_path, nlp, raw_dir, doc_signatures, indexed
+):
+    kwargs = dict(
+        input_filepath=str(raw_dir / "*.txt"),
+        nlp=nlp,
+        specific_stopwords=nlp_dicts.stopwords_bbc_monitoring,
+        chunk_size=60,
+    )
+    fpath = str(tmp_path / ("corpus" if indexed else "corpus.bin.gz"))
+
+    # built without the last file
+    added = raw_dir / "Nile_2001_03.txt"
+    text_added = added.read_text()
+    added.unlink()
+    make_corpus.update_corpus(output_filepath=fpath, indexed=indexed, **kwargs)
+
+    # one file changed, one deleted and one added
+    with open(str(raw_dir / "Indus_2003.txt"), "a") as f:
+        f.write("\n\nThe Indus floods were severe.")
+    (raw_dir / "Mekong_2001_07.txt").unlink()
+    added.write_text(text_added)
+
+    corpus = make_corpus.update_corpus(
+        output_filepath=fpath, return_data=True, indexed=indexed, **kwargs
+    )
+    expected = list(
+        make_corpus.create_corpus(
+            output_filepath=str(tmp_path / "full.bin.gz"),
+            return_data=True,
+            **kwargs
+        )
+    )
+    if not indexed:
+        assert doc_signatures(corpus) == doc_signatures(expected)
+        return
+
+    with corpus:
+        assert doc_signatures(corpus) == doc_signatures(expected)
+        assert doc_signatures(corpus.query(basin="Nile")) == doc_signatures(
+            [doc for doc in expected if doc._.meta["basin"] == "Nile"]
+        )
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import textacy.tm
+from sklearn.utils.extmath import randomized_svd
+from src.data import io
+from src.models import predict_model, train_model
+
+TOKENIZED_DOCS = [
+    ["dam", "water", "dam", "nile basin", "treaty"],
+    ["water", "river", "drought", "flood"],
+    ["dam", "river", "flood", "flood", "power"],
+    ["water", "treaty", "drought", "canal"],
+    ["drought", "dam", "water", "treaty", "river"],
+    ["power", "dam", "canal", "nile basin"],
+]
+BASIN_GROUP = ["Nile", "Mekong", "Mekong", "Indus", "Indus", "Nile"]
+
+
+@pytest.fixture(scope="module")
+def grp_term_matrix():
+    vectorizer = train_model.group_vectorizer(min_df=0.0, max_df=1.0)
+    return vectorizer.fit_transform(TOKENIZED_DOCS, BASIN_GROUP)
+
+
+@pytest.mark.parametrize("model_type", sorted(predict_model.MODEL_TYPES))
+def test_topic_model_round_trip(tmp_path, grp_term_matrix, model_type):
+    params = dict(predict_model.MODEL_TYPES[model_type])
+    model = textacy.tm.TopicModel(
+        model=params.pop("model"), n_topics=2, **params
+    )
+    model.fit(grp_term_matrix)
+
+    fpath = str(tmp_path / model_type)
+    predict_model.write_topic_model(model, fpath)
+    reloaded = io.read_topic_model(fpath, mmap_mode=None)
+
+    np.testing.assert_array_equal(
+        reloaded.model.components_, model.model.components_
+    )
+    np.testing.assert_allclose(
+        reloaded.transform(grp_term_matrix), model.transform(grp_term_matrix)
+    )
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 2 ** 16])
+def test_residual_components(grp_term_matrix, block_size):
+    model = textacy.tm.TopicModel(model="nmf", n_topics=1)
+    W = model.model.fit_transform(grp_term_matrix)
+    H = model.model.components_
+
+    W_new, H_new = predict_model._residual_components(
+        grp_term_matrix, W, H, 2, block_size=block_size
+    )
+
+    # dense reference
+    residual = np.maximum(grp_term_matrix.toarray() - W @ H, 0)
+    U, S, VT = randomized_svd(residual, 2, random_state=1)
+    np.testing.assert_allclose(W_new, np.sqrt(S) * np.abs(U), atol=1e-10)
+    np.testing.assert_allclose(
+        H_new, np.sqrt(S)[:, None] * np.abs(VT), atol=1e-10
+    )
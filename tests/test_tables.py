@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+from src.data import tables
+
+
+@pytest.fixture
+def df_counts():
+    counts = np.arange(100, 0, -1)
+    return pd.DataFrame(
+        {"count": counts, "freq": counts / counts.sum()},
+        index=["term_{}".format(i) for i in range(len(counts))],
+    )
+
+
+@pytest.fixture
+def fpath(tmp_path, df_counts):
+    fpath = str(tmp_path / "counts.parquet")
+    tables.write_table(df_counts, fpath, row_group_size=7)
+    return fpath
+
+
+def test_round_trip(fpath, df_counts):
+    pdt.assert_frame_equal(tables.read_table(fpath), df_counts)
+
+
+def test_columns(fpath, df_counts):
+    pdt.assert_frame_equal(
+        tables.read_table(fpath, columns=["freq"]), df_counts[["freq"]]
+    )
+
+
+def test_filters(fpath, df_counts):
+    pdt.assert_frame_equal(
+        tables.read_table(fpath, filters=[("count", ">=", 50)]),
+        df_counts[df_counts["count"] >= 50],
+    )
+
+
+@pytest.mark.parametrize("n", [0, 1, 7, 30, 100, 1000])
+def test_top_n(fpath, df_counts, n):
+    pdt.assert_frame_equal(tables.read_table(fpath, n=n), df_counts.head(n))
+
+
+def test_n_and_filters_are_exclusive(fpath):
+    with pytest.raises(ValueError):
+        tables.read_table(fpath, filters=[("count", ">=", 50)], n=10)
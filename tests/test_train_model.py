@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from src.data import io
+from src.features import extract
+from src.models import train_model
+
+TOKENIZED_DOCS = [
+    ["dam", "water", "dam", "nile basin"],
+    [],
+    ["water", "river", "drought"],
+    ["dam", "river", "flood", "flood"],
+    ["water", "treaty"],
+    ["drought", "dam", "water", "treaty", "river"],
+]
+BASIN_GROUP = ["Nile", "Nile", "Mekong", "Nile", "Indus", "Mekong"]
+YEAR_GROUP = ["2001", "2001", "2001", "2002", "2002", "2003"]
+
+
+@pytest.fixture
+def term_streams(tmp_path):
+    dirpath = str(tmp_path / "terms")
+    extract.write_term_streams(
+        TOKENIZED_DOCS, BASIN_GROUP, YEAR_GROUP, dirpath=dirpath
+    )
+    return dirpath
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 2 ** 20])
+@pytest.mark.parametrize(
+    "vectorizer_kwargs",
+    [{}, {"min_df": 0.0, "max_df": 1.0}, {"apply_idf": False, "norm": None}],
+)
+def test_fit_transform_term_ids_equivalence(
+    term_streams, block_size, vectorizer_kwargs
+):
+    reference = train_model.group_vectorizer(**vectorizer_kwargs)
+    expected = reference.fit_transform(TOKENIZED_DOCS, BASIN_GROUP)
+
+    candidate = train_model.group_vectorizer(**vectorizer_kwargs)
+    result = train_model.group_vectorizer_fit_transform_term_ids(
+        candidate,
+        term_streams,
+        group="basin",
+        save=False,
+        block_size=block_size,
+    )
+
+    assert result.shape == expected.shape
+    assert result.dtype == expected.dtype
+    assert candidate.vocabulary_terms == reference.vocabulary_terms
+    assert candidate.vocabulary_grps == reference.vocabulary_grps
+    for attr in ("data", "indices", "indptr"):
+        np.testing.assert_array_equal(
+            getattr(result, attr), getattr(expected, attr)
+        )
+    if reference._idf_diag is None:
+        assert candidate._idf_diag is None
+    else:
+        np.testing.assert_array_equal(
+            candidate._idf_diag.diagonal(), reference._idf_diag.diagonal()
+        )
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 5, 100])
+def test_count_group_terms(block_size):
+    term_ids = np.array([0, 1, 0, 2, 1, 3, 3], dtype=np.uint32)
+    doc_offsets = np.array([0, 3, 3, 5, 7])
+    doc_grp_ids = np.array([0, 1, 1, 0], dtype=np.intc)
+
+    counts = train_model._count_group_terms(
+        term_ids, doc_offsets, doc_grp_ids, (2, 4), block_size
+    )
+
+    np.testing.assert_array_equal(
+        counts.toarray(), [[2, 1, 0, 2], [0, 1, 1, 0]]
+    )
+
+
+def test_vectorizer_round_trip(tmp_path):
+    vectorizer = train_model.group_vectorizer(min_df=0.0, max_df=1.0)
+    grp_term_matrix = vectorizer.fit_transform(TOKENIZED_DOCS, BASIN_GROUP)
+
+    fpath = str(tmp_path / "vectorizer")
+    train_model.write_vectorizer(vectorizer, fpath)
+    reloaded = io.read_vectorizer(fpath, mmap_mode=None)
+
+    assert reloaded.vocabulary_terms == vectorizer.vocabulary_terms
+    assert reloaded.vocabulary_grps == vectorizer.vocabulary_grps
+    np.testing.assert_allclose(
+        reloaded.transform(TOKENIZED_DOCS, BASIN_GROUP).toarray(),
+        grp_term_matrix.toarray(),
+    )